@@ -7,6 +7,15 @@
 "nnoremap <buffer><silent> dd :call DeleteTask()<CR>
 nnoremap <silent> <leader>T :call LoadTasks()<CR>
 
+" Opt-in: sync in the background once Neovim has started, so that the first
+" LoadTasks doesn't wait for the network. The timer lets the UI draw first.
+if get(g:, 'pytodoist_prefetch', 0)
+    :autocmd VimEnter * call timer_start(0, {-> TodoistPrefetch()})
+endif
+
+" Sub-tasks are indented by 4 spaces per level.
+:autocmd FileType todoist setlocal shiftwidth=4 expandtab
+
 :autocmd FileType todoist nnoremap <buffer><silent> X :call CompleteTask()<CR>
 
 :autocmd FileType todoist nnoremap <buffer><silent> m :call MoveTask()<CR>
@@ -14,9 +23,18 @@ nnoremap <silent> <leader>T :call LoadTasks()<CR>
 
 :autocmd FileType todoist nnoremap <buffer><silent> <leader>l :call AssignLabel()<CR>
 
+:autocmd FileType todoist nnoremap <buffer><silent> <CR> :call ToggleProject()<CR>
+
 :autocmd FileType todoist nnoremap <buffer><silent> o :normal! o[ ]  <esc>i<kDel>
 :autocmd FileType todoist nnoremap <buffer><silent> O :normal! O[ ]  <esc>i<kDel>
 
+" The completed tasks are fetched page by page when scrolling the archive, which only
+" keeps the pages close to the visible lines.
+:autocmd FileType todoistarchive autocmd WinScrolled <buffer> call TodoistArchiveScrolled(line('w0'), line('w$'))
+
+" Long buffers are only highlighted around the visible lines.
+:autocmd FileType todoist autocmd WinScrolled <buffer> call TodoistViewportChanged(line('w0'), line('w$'))
+
 
 function! CaptureFzfOutput(cmd)
     let g:fzf_output = a:cmd
@@ -1,67 +1,482 @@
+from __future__ import annotations
+
 import os
 import re
-import subprocess
+import sys
+import json
+import stat
+import struct
+import uuid
+import fcntl
+import queue
+import atexit
+import shutil
+import socket
+import weakref
+import importlib
+import threading
+import socketserver
+import time
+import heapq
+import bisect
+import functools
+import shlex
+import tempfile
+import contextlib
 from pathlib import Path
-from collections import deque
+from collections import deque, defaultdict, Counter, OrderedDict
+from itertools import islice
 from abc import abstractmethod
 from copy import copy, deepcopy
 from dataclasses import dataclass
-from typing import List, Optional, Union, Callable
+from typing import List, Optional, Union, Callable, Iterable, Set, Tuple
 
 import pynvim
-import todoist
+
+
+class LazyModule:
+    """Imports the module `name` on the first access to one of its attributes.
+
+    Neovim loads the remote plugins when the host starts, even in sessions that never
+    open a `.todoist` buffer: the heavy dependencies are only imported when used."""
+
+    def __init__(self, name: str, namespace: dict):
+        self._name = name
+        self._namespace = namespace
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("_"):
+            # Looked up by introspection, like the discovery of the handlers by the
+            # plugin host: not worth an import.
+            raise AttributeError(attr)
+        module = importlib.import_module(self._name)
+        # The global now refers to the module itself, so that later accesses don't
+        # go through this.
+        self._namespace[self._name] = module
+        return getattr(module, attr)
+
+
+class DeferredClass:
+    """A class defined by `define` when first used, so that defining it doesn't
+    import the modules of its bases."""
+
+    def __init__(self, define: Callable[[], type]):
+        self._define = define
+
+    @functools.cached_property
+    def cls(self) -> type:
+        return self._define()
+
+    def __call__(self, *args, **kwargs):
+        return self.cls(*args, **kwargs)
+
+
+argparse = LazyModule("argparse", globals())
+difflib = LazyModule("difflib", globals())
+requests = LazyModule("requests", globals())
+subprocess = LazyModule("subprocess", globals())
+todoist = LazyModule("todoist", globals())
 
 NULL = "null"
 SMART_TAG = True
+API_ENDPOINT = "https://api.todoist.com"
+# Connect and read timeouts, in seconds.
+HTTP_TIMEOUT = (
+    float(os.environ.get("TODOIST_CONNECT_TIMEOUT", 5)),
+    float(os.environ.get("TODOIST_READ_TIMEOUT", 30)),
+)
+JOURNAL_PATH = os.environ.get(
+    "PYTODOIST_JOURNAL", str(Path.home() / ".cache" / "pytodoist" / "journal.jsonl")
+)
+# The socket, and its lock files, live in a directory private to the user (see
+# `private_directory`).
+DAEMON_SOCKET_PATH = os.environ.get(
+    "PYTODOIST_DAEMON_SOCKET",
+    str(
+        Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir())
+        / f"pytodoist-{os.getuid()}"
+        / "daemon.sock"
+    ),
+)
+# Seconds between two background syncs. Polling is disabled when unset or zero.
+POLL_INTERVAL = float(os.environ.get("PYTODOIST_POLL_INTERVAL", 0))
+# Comma separated names of the projects (and of their sub-projects) to work with.
+# All the projects are used when unset.
+PROJECT_NAMES = [
+    name.strip()
+    for name in os.environ.get("PYTODOIST_PROJECTS", "").split(",")
+    if name.strip()
+]
+# Render the projects collapsed, and only materialize the tasks of expanded ones.
+COLLAPSE_PROJECTS = bool(os.environ.get("PYTODOIST_COLLAPSE_PROJECTS"))
+# Buffers longer than this (in lines) are only highlighted around the visible lines.
+VIEWPORT_THRESHOLD = int(os.environ.get("PYTODOIST_VIEWPORT_THRESHOLD", 5000))
+# Lines highlighted above and below the visible ones, so that small scrolls are free.
+VIEWPORT_MARGIN = 100
+# Sync in the background as soon as the plugin host starts.
+PREFETCH = bool(os.environ.get("PYTODOIST_PREFETCH"))
+# The first `load_tasks` renders a prefetched state younger than this (in seconds)
+# without syncing again.
+PREFETCH_MAX_AGE = 30.0
+# Lines written at once by `load_tasks` for large workspaces, after the first screen.
+RENDER_CHUNK_SIZE = 2000
+# Every handler call is appended to this file, as a JSON line. Only the in-memory
+# statistics (see `:TodoistStats`) are kept when unset.
+STATS_LOG_PATH = os.environ.get("PYTODOIST_STATS_LOG")
+
+
+class RpcStats:
+    """Counts the RPCs sent to Neovim and measures the latency of the handlers.
+
+    The latest `window` calls of every handler are kept to compute percentiles.
+    Every call is also appended as a JSON line to `log_path`."""
+
+    def __init__(self, log_path: Optional[str] = None, window: int = 500):
+        self.log_path = log_path
+        self.rpc_count = 0
+        self.rpc_count_by_method = Counter()
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._rpc_counts = defaultdict(lambda: deque(maxlen=window))
+
+    def instrument(self, nvim: pynvim.Nvim):
+        # Every API call (including the ones made through buffers, windows and
+        # `nvim.current`) ends up in `Nvim.request`.
+        request = nvim.request
+
+        def counted_request(name, *args, **kwargs):
+            self.rpc_count += 1
+            self.rpc_count_by_method[name] += 1
+            return request(name, *args, **kwargs)
+
+        nvim.request = counted_request
+
+    def record(self, handler: str, duration: float, rpc_count: int):
+        self._durations[handler].append(duration)
+        self._rpc_counts[handler].append(rpc_count)
+        if self.log_path is None:
+            return
+        entry = {
+            "time": time.time(),
+            "handler": handler,
+            "duration_ms": round(duration * 1000, 3),
+            "rpcs": rpc_count,
+        }
+        log_path = Path(self.log_path)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(log_path), log_path.open("a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def percentiles(self, handler: str, ps=(50, 90, 99)) -> dict:
+        durations = sorted(self._durations[handler])
+        if not durations:
+            return dict()
+        return {
+            p: durations[min(len(durations) - 1, len(durations) * p // 100)] for p in ps
+        }
+
+    def summary(self) -> List[str]:
+        lines = [
+            f"{'handler':<20} {'calls':>6} {'p50 ms':>8} {'p90 ms':>8} "
+            f"{'p99 ms':>8} {'rpcs/call':>10}"
+        ]
+        for handler in sorted(self._durations.keys()):
+            percentiles = self.percentiles(handler)
+            rpc_counts = self._rpc_counts[handler]
+            lines.append(
+                f"{handler:<20} {len(rpc_counts):>6} "
+                f"{percentiles[50] * 1000:>8.1f} {percentiles[90] * 1000:>8.1f} "
+                f"{percentiles[99] * 1000:>8.1f} "
+                f"{sum(rpc_counts) / len(rpc_counts):>10.1f}"
+            )
+        lines.append(f"Total RPCs: {self.rpc_count}")
+        return lines
+
+
+def instrumented(handler):
+    """Record the duration and the number of RPCs of a `Plugin` handler."""
+
+    @functools.wraps(handler)
+    def wrapper(self, *args, **kwargs):
+        rpc_count = self.stats.rpc_count
+        start = time.perf_counter()
+        try:
+            return handler(self, *args, **kwargs)
+        finally:
+            self.stats.record(
+                handler.__name__,
+                time.perf_counter() - start,
+                self.stats.rpc_count - rpc_count,
+            )
+
+    return wrapper
+
+
+@dataclass
+class RenderStream:
+    """State of a progressive rendering of the `.todoist` buffer."""
+
+    generation: int
+    buffer: int
+    items: Iterable
+    cursor: Tuple[int, int]
+    lines: List[str]
+    project: Optional["Project"] = None
+    cursor_is_restored: bool = False
+
+
+class SyncPoller:
+    """Calls `poll` every `interval` seconds, on a worker thread."""
+
+    def __init__(self, interval: float, poll: Callable):
+        self.interval = interval
+        self.poll = poll
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except requests.RequestException:
+                # We'll try again at the next tick.
+                pass
 
 
 @pynvim.plugin
 class Plugin(object):
     def __init__(self, nvim):
         self.nvim = nvim
-        if not os.environ.get("TODOIST_API_KEY"):
-            raise ValueError("Can't find the TODOIST_API_KEY env var.")
-        self.todoist = TodoistInterface(
-            todoist.TodoistAPI(os.environ.get("TODOIST_API_KEY")),
-            custom_sections=[
-                CustomSection("Today", lambda task: "today" in task.labels),
-                CustomSection("This Week", lambda task: "thisweek" in task.labels),
-            ],
-        )
+        self.stats = RpcStats(log_path=STATS_LOG_PATH)
+        self.stats.instrument(self.nvim)
+        # The client is created by the first handler using it. See `_get_todoist`.
+        self.todoist = None
+        self._todoist_lock = threading.Lock()
         self.parsed_buffer_since_last_save = None
         self.parsed_buffer = None
+        # Task lines known to be well formatted. See `_force_formatting`.
+        self._formatted_lines = set()
+        self._highlight_namespace = None
+        # Incremented by every `load_tasks`, to interrupt a previous rendering.
+        self._render_generation = 0
+        # Lines highlighted by the last refresh, as `(parsed_buffer, start, end)`.
+        self._highlighted_range = None
+        self.archive = None
+        self._archive_buffer = None
+        # The number of lines of every page appended to the archive buffer, and the
+        # pages currently filled. See `_refresh_archive`.
+        self._archive_page_lengths = []
+        self._archive_filled_pages = set()
+        # The latest remote changes received while the buffer had unsaved changes, as
+        # `(sync_token, response)`. They are merged by the sync of the next save.
+        # The sync token doesn't move in the meantime: every response holds all the
+        # changes of the previous ones.
+        self.pending_remote_changes = None
+        self.poller = None
+        self._prefetch_thread = None
+        self._prefetched_at = None
+        if PREFETCH:
+            self._start_prefetch()
+
+    def _get_todoist(self) -> TodoistInterface:
+        # Not a property: the plugin host inspects the members of the plugin to find
+        # its handlers, which must not connect. Also used from the prefetch and
+        # poller threads.
+        with self._todoist_lock:
+            if self.todoist is None:
+                self.todoist = self._connect()
+                if POLL_INTERVAL > 0:
+                    self.poller = SyncPoller(POLL_INTERVAL, self._poll).start()
+            return self.todoist
+
+    def _connect(self) -> TodoistInterface:
+        if not os.environ.get("TODOIST_API_KEY"):
+            raise ValueError("Can't find the TODOIST_API_KEY env var.")
+        custom_sections = [
+            CustomSection("Today", labels=["today"]),
+            CustomSection("This Week", labels=["thisweek"]),
+        ]
+        project_names = PROJECT_NAMES or None
+        if os.environ.get("PYTODOIST_DAEMON"):
+            # The workspace is shared with the other Neovim instances, through a
+            # daemon that we start if needed.
+            connection = DaemonConnection.connect_or_spawn(
+                DAEMON_SOCKET_PATH, on_push=self._on_push
+            )
+            interface = TodoistInterface(
+                DaemonApi(connection),
+                custom_sections=custom_sections,
+                project_names=project_names,
+            )
+        else:
+            interface = TodoistInterface.from_token(
+                os.environ.get("TODOIST_API_KEY"),
+                api_endpoint=os.environ.get("TODOIST_API_ENDPOINT", API_ENDPOINT),
+                journal=CommandJournal(JOURNAL_PATH),
+                custom_sections=custom_sections,
+                project_names=project_names,
+            )
+        if COLLAPSE_PROJECTS:
+            interface.expanded_projects = set()
+        return interface
 
     def _get_buffer_content(self) -> List[str]:
         return self.nvim.current.buffer[:]
 
+    def _on_push(self):
+        # Called from the thread reading the daemon socket.
+        self.nvim.async_call(self._reload_if_unmodified)
+
+    def _reload_if_unmodified(self):
+        if Path(self.nvim.current.buffer.name).name != ".todoist":
+            return
+        if self.nvim.eval("&modified"):
+            # The remote changes will show up on the next save.
+            return
+        self.load_tasks([])
+
+    @pynvim.function("TodoistPrefetch", sync=False)
+    def prefetch(self, args):
+        """Sync in the background, so that the first `LoadTasks` is instant."""
+        self._start_prefetch()
+
+    def _start_prefetch(self):
+        if self._prefetch_thread is not None or self._prefetched_at is not None:
+            return
+        # The sync happens on a thread: neither the editor nor the other plugins of
+        # the host wait for it.
+        self._prefetch_thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._prefetch_thread.start()
+
+    def _prefetch(self):
+        try:
+            self._get_todoist().sync()
+        except requests.RequestException:
+            # `load_tasks` will try again.
+            return
+        self._prefetched_at = time.monotonic()
+
+    def _sync_unless_prefetched(self):
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+        prefetched_at, self._prefetched_at = self._prefetched_at, None
+        if prefetched_at is not None:
+            if time.monotonic() - prefetched_at < PREFETCH_MAX_AGE:
+                # Rendering from the warm state.
+                return
+        self._get_todoist().sync()
+
+    def _poll(self):
+        # Called from the poller thread: only the request is made here. The changes
+        # are applied from the event loop.
+        sync_token, response = self._get_todoist().fetch_changes()
+        if not TodoistInterface.has_changes(response):
+            # Nothing to re-render.
+            return
+        pending = self.pending_remote_changes
+        if pending is not None and pending[1]["sync_token"] == response["sync_token"]:
+            # Nothing new since the parked changes, which are applied if the buffer
+            # was cleaned in the meantime (e.g. by undoing the changes).
+            self.nvim.async_call(self._apply_pending_remote_changes)
+            return
+        self.nvim.async_call(self._apply_remote_changes, sync_token, response)
+
+    def _apply_pending_remote_changes(self):
+        if self.pending_remote_changes is None:
+            return
+        name, modified = self.nvim.api.call_atomic(
+            [["nvim_buf_get_name", [0]], ["nvim_eval", ["&modified"]]]
+        )[0]
+        if Path(name).name == ".todoist" and not modified:
+            self._apply_remote_changes(*self.pending_remote_changes)
+
+    def _apply_remote_changes(self, sync_token: str, response: dict):
+        if self.parsed_buffer_since_last_save is None:
+            # The `.todoist` buffer hasn't been loaded yet.
+            return
+        name, modified, lines = self.nvim.api.call_atomic(
+            [
+                ["nvim_buf_get_name", [0]],
+                ["nvim_eval", ["&modified"]],
+                ["nvim_buf_get_lines", [0, 0, -1, True]],
+            ]
+        )[0]
+        if Path(name).name != ".todoist" or modified:
+            # Applying the changes now would mix them with the unsaved ones.
+            self.pending_remote_changes = (sync_token, response)
+            return
+        todoist = self._get_todoist()
+        if not todoist.apply_changes(sync_token, response):
+            # Another sync happened in the meantime, and already has the changes.
+            self.pending_remote_changes = None
+            return
+
+        new_lines = [str(item) for item in todoist]
+        calls = [
+            ["nvim_buf_set_lines", [0, start, end, True, replacement]]
+            for start, end, replacement in line_edits(lines, new_lines)
+        ]
+        if calls:
+            # The buffer now matches Todoist: it isn't considered modified.
+            self.nvim.api.call_atomic(
+                [*calls, ["nvim_command", ["setlocal nomodified"]]]
+            )
+        self.pending_remote_changes = None
+        self.parsed_buffer_since_last_save = ParsedBuffer(new_lines, todoist)
+        self.parsed_buffer = ParsedBuffer(new_lines, todoist)
+        if calls:
+            self._refresh_folds()
+            self._setup_highlight_groups()
+            self._refresh_highlights()
+
     @pynvim.autocmd("InsertEnter", pattern=".todoist", sync=False)
     def register_current_line(self):
         pass
 
     @pynvim.autocmd("TextYankPost", pattern=".todoist", sync=False)
+    @instrumented
     def text_yank_post(self):
         self._refresh_parsed_buffer()
         self._refresh_highlights()
 
     @pynvim.autocmd("InsertLeave", pattern=".todoist", sync=False)
+    @instrumented
     def insert_leave(self):
         self._refresh_parsed_buffer()
         self._refresh_highlights()
 
     @pynvim.autocmd("TextChanged", pattern=".todoist", sync=False)
+    @instrumented
     def text_changed(self):
         self._refresh_parsed_buffer()
         self._refresh_highlights()
+        # Undoing the unsaved changes brings the buffer back to its saved state.
+        self._apply_pending_remote_changes()
+
+    @pynvim.autocmd("BufEnter", pattern=".todoist", sync=False)
+    @instrumented
+    def buf_enter(self):
+        # Changes received while another buffer was current.
+        self._apply_pending_remote_changes()
 
     @pynvim.function("CompleteTask")
+    @instrumented
     def complete_task(self, args):
         line_index = self._get_current_line_index()
-        task = self.parsed_buffer[line_index - 1]
+        task = self.parsed_buffer.get_item_for_update(line_index - 1)
         self.nvim.command("echo 'Task registered as completed.'")
         task.complete(impact_remote=False)
         self.nvim.command("d")
 
     @pynvim.autocmd("BufWritePre", pattern=".todoist", sync=True)
+    @instrumented
     def save_buffer(self):
         if self.parsed_buffer_since_last_save is None:
             # This is triggered at the first initialization of `_load_tasks`.
@@ -69,49 +484,78 @@ class Plugin(object):
             # and saving.
             return
 
+        todoist = self._get_todoist()
         updated_buffer = ParsedBuffer(self._get_buffer_content())
         self.parsed_buffer_since_last_save.compare_with(updated_buffer)
-        self.todoist.commit()
-        self.todoist.sync()
+        todoist.commit()
+        todoist.sync()
+        self.pending_remote_changes = None
         self.parsed_buffer_since_last_save = ParsedBuffer(
-            self._get_buffer_content(), self.todoist
+            self._get_buffer_content(), todoist
         )
         self._refresh_parsed_buffer()
         self._setup_highlight_groups()
         self._refresh_highlights()
         # self.load_tasks(None)
+        if todoist.is_offline:
+            self.echo(
+                f"Todoist is unreachable: {len(todoist.journal)} change(s) "
+                "saved locally."
+            )
 
     @pynvim.autocmd("InsertLeave", pattern=".todoist", sync=True)
     def register_updated_line(self):
         pass
 
     def _refresh_parsed_buffer(self):
-        self.parsed_buffer = ParsedBuffer(self._get_buffer_content(), self.todoist)
-        self._force_formatting()
+        lines = self._get_buffer_content()
+        self.parsed_buffer = ParsedBuffer(lines, self._get_todoist())
+        self._force_formatting(lines)
+
+    def _force_formatting(self, lines: List[str]):
+        fixes = []
+        formatted_lines = set()
+        for i, (line, item) in enumerate(zip(lines, self.parsed_buffer)):
+            if not isinstance(item, Task):
+                continue
+            if line in self._formatted_lines:
+                # This line was already checked during a previous refresh.
+                formatted_lines.add(line)
+                continue
+            # The `line` can sometimes be ill-formed, like `Task 10` instead of
+            # `[ ] Task 10`.
+            # This likely happens when the user is inserting multiple
+            # tasks in a row without pressing "<esc>o" between each entry.
+            # Re-parsing the task and re-printing it (if needed) will enforce that
+            # we always have properly formated tasks.
+            formatted_line = str(Task.parse(line))
+            if formatted_line != line:
+                fixes.append(
+                    ["nvim_buf_set_lines", [0, i, i + 1, True, [formatted_line]]]
+                )
+            formatted_lines.add(formatted_line)
+        self._formatted_lines = formatted_lines
 
-    def _force_formatting(self):
-        for i, (line, item) in enumerate(
-            zip(self.nvim.current.buffer[:], self.parsed_buffer)
-        ):
-            if isinstance(item, Task):
-                # The `line` can sometimes be ill-formed, like `Task 10` instead of
-                # `[ ] Task 10`.
-                # This likely happens when the user is inserting multiple
-                # tasks in a row without pressing "<esc>o" between each entry.
-                # Re-parsing the task and re-printing it (if needed) will enforce that
-                # we always have properly formated tasks.
-                task = Task.parse(line)
-                if str(task) != line:
-                    # Reprinting if necessary. This shouldn't affect many lines.
-                    self.nvim.current.buffer[i] = str(task)
+        # Reprinting if necessary. This shouldn't affect many lines, and all of them
+        # are sent at once.
+        if fixes:
+            self.nvim.api.call_atomic(fixes)
 
     def _input_from_fzf(self, source: List[str]) -> str:
+        # Inlining the candidates in the `fzf#run` command would force Neovim to parse
+        # a potentially huge list literal (and would break on quotes). Instead, we
+        # stream them to fzf from a temporary file.
+        fd, source_path = tempfile.mkstemp(dir=scratch_directory(), prefix="fzf-")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(source))
+        source_command = f"cat {shlex.quote(source_path)}".replace("'", "''")
+
         # This command instantiates a global vimscript variable named `fzf_output`.
         self.nvim.api.command("call ResetFzfOutput()")
         self.nvim.api.command(
             "call fzf#run(fzf#wrap({"
             "'sink': function('CaptureFzfOutput'),"
-            f"'source': {source}"
+            f"'source': '{source_command}'"
             "}))"
         )
         # However fzf#run returns directly (it doesn't wait for the user to complete
@@ -123,66 +567,67 @@ class Plugin(object):
                 fzf_output = self.nvim.api.eval("fzf_output")
             except:
                 pass
+        os.unlink(source_path)
 
         return fzf_output
 
     @pynvim.function("MoveTask", sync=False, range=True)
+    @instrumented
     def move_task(self, args, _range):
         if len(args) == 0:
             self.nvim.api.command("set modifiable")
-            projects = [project.name for project in self.todoist.projects]
+            projects = [project.name for project in self._get_todoist().projects]
             project_name = self._input_from_fzf(source=projects)
         else:
             project_name = args[0]
         if project_name == "":
             return
 
-        self.nvim.api.command("let position = getcurpos()")
-        buf_index, line_index, col_index, offset, _ = self.nvim.api.eval("position")
-
-        project = self.todoist.get_project_by_name(project_name)
+        project = self._get_todoist().get_project_by_name(project_name)
 
         # # TODO: still unsure if we want to do this...
         # # item = self.parsed_buffer[line_index - 1]
         # # item.move(project_id=project.id)
 
-        # Finding where to paste the tasks.
-        for i, item in enumerate(self.parsed_buffer):
-            if isinstance(item, Project) and item.id == project.id:
-                # We found the project in which to place the task. We could place the
-                # task right here. However we choose to place the task at the bottom of
-                # the task list by default.
-                # We need to iterate one last time to find it.
-                break
-        for j, item in enumerate(self.parsed_buffer[i:]):
-            if isinstance(item, ProjectSeparator):
-                # We finally found where to place the task.
-                break
+        # We could place the task right below the project name. However we choose to
+        # place the task at the bottom of the task list by default, which is where
+        # the project separator is.
+        target_index = None
+        if project is not None:
+            target_index = self.parsed_buffer.get_project_separator_index(project)
+        if target_index is None:
+            self.nvim.command(f"echo 'Project {project_name} is not displayed.'")
+            return
 
-        # Counting the number of lines that we want to move.
-        change_amplitude = _range[1] - _range[0] + 1
+        # Fetching the cursor position and the lines to move in a single round-trip.
+        (cursor, lines), _ = self.nvim.api.call_atomic(
+            [
+                ["nvim_win_get_cursor", [0]],
+                ["nvim_buf_get_lines", [0, _range[0] - 1, _range[1], True]],
+            ]
+        )
+        line_index, col_index = cursor
 
-        # We need to paste the line(s) at position `i + j `.
-        # First, copying.
-        self.nvim.api.command(f"{_range[0]},{_range[1]}y")
-        self.nvim.api.command(f"{i+j}pu")
-        # Then, deleting the original task.
         # We need to be extra careful in case we move a task upwards in the buffer.
-        # In that case, the range of deletion has been shifted.
-        delta = 0 if _range[0] < i + j else change_amplitude
-        self.nvim.api.command(f"{_range[0]+delta},{_range[1]+delta}d")
-        self.nvim.api.command(
-            f"call setpos('.',"
-            f"[{buf_index}, {line_index+delta}, {col_index}, {offset}]"
-            ")"
+        # In that case, the lines to delete (and the cursor) are shifted.
+        delta = 0 if _range[0] - 1 < target_index else len(lines)
+        self.nvim.api.call_atomic(
+            [
+                ["nvim_buf_set_lines", [0, target_index, target_index, True, lines]],
+                [
+                    "nvim_buf_set_lines",
+                    [0, _range[0] - 1 + delta, _range[1] + delta, True, []],
+                ],
+                ["nvim_win_set_cursor", [0, [line_index + delta, col_index]]],
+            ]
         )
 
     @pynvim.function("AssignLabel", sync=False, range=False)
+    @instrumented
     def assign_label(self, args):
         if len(args) == 0:
             self.nvim.api.command("set modifiable")
-            # TODO: create a Label wrapper class?
-            labels = [label["name"] for label in self.todoist.api.state["labels"]]
+            labels = list(self._get_todoist().labels_by_name.keys())
             label_name = self._input_from_fzf(source=labels)
         else:
             label_name = args[0]
@@ -191,30 +636,231 @@ class Plugin(object):
 
         # Getting the task at the current cursor position.
         line_index = self._get_current_line_index()
-        task = self.parsed_buffer[line_index - 1]
+        task = self.parsed_buffer.get_item_for_update(line_index - 1)
 
         # Getting the label we want to assign (we need its id).
-        label = self.todoist.get_label_by_name(label_name)
+        label = self._get_todoist().get_label_by_name(label_name)
 
         # Getting the list of current labels (we want to append to that list).
-        current_labels = task.labels
-        task.update(labels=[label["id"], *current_labels])
-        self.nvim.command(f"echo 'Task registered with label: {label['name']}.'")
+        current_label_ids = [current_label.id for current_label in task.labels]
+        task.update(labels=[label.id, *current_label_ids])
+        self.nvim.command(f"echo 'Task registered with label: {label.name}.'")
 
         # # TODO: still unsure if we want to do this...
         # # item.move(project_id=project.id)
 
+    @pynvim.command("TodoistSearch", nargs="+", sync=True)
+    @instrumented
+    def todoist_search(self, args):
+        if self.parsed_buffer is None:
+            self.echo("Load the tasks first, with `:call LoadTasks()`.")
+            return
+        tasks = self._get_todoist().search(" ".join(args))
+        line_indices = [self.parsed_buffer.get_task_line_index(task) for task in tasks]
+        line_indices = [i for i in line_indices if i is not None]
+        if len(line_indices) == 0:
+            self.nvim.command("echo 'No matching task.'")
+            return
+
+        # All the matches are sent to the location list (so that they can be browsed
+        # with `:lnext`) and we jump to the best one.
+        self.nvim.call(
+            "setloclist",
+            0,
+            [
+                {
+                    "bufnr": self.nvim.current.buffer.number,
+                    "lnum": i + 1,
+                    "text": self.parsed_buffer[i].content,
+                }
+                for i in line_indices
+            ],
+        )
+        self.nvim.current.window.cursor = (line_indices[0] + 1, 0)
+
+    @pynvim.function("ToggleProject", sync=True)
+    @instrumented
+    def toggle_project(self, args):
+        """Expand or collapse the project under the cursor."""
+        todoist = self._get_todoist()
+        if todoist.expanded_projects is None:
+            self.echo("All the projects are expanded.")
+            return
+        (row, _), modified = self.nvim.api.call_atomic(
+            [["nvim_win_get_cursor", [0]], ["nvim_eval", ["&modified"]]]
+        )[0]
+        project = self.parsed_buffer.get_project_above(row)
+        if not isinstance(project, Project):
+            return
+        if project.data is None:
+            # A new (or renamed) project: it has no tasks on Todoist's side, and
+            # collapsing it would drop the ones typed under it.
+            self.echo("Save the buffer before toggling a new project.")
+            return
+        separator_index = self.parsed_buffer.get_project_separator_index(project)
+        if separator_index is None or separator_index < row - 1:
+            # The cursor is in a custom section.
+            return
+        if todoist.is_expanded(project) and modified:
+            self.echo("Save the buffer before collapsing a project.")
+            return
+
+        if todoist.is_expanded(project):
+            todoist.expanded_projects.discard(project.id)
+        else:
+            todoist.expanded_projects.add(project.id)
+        # Only the lines of this project are replaced, in the buffer and in the
+        # snapshot the next save is compared to.
+        lines = self._project_content(project)
+        first_index = self.parsed_buffer.get_project_line_index_above(row) + 2
+        calls = [["nvim_buf_set_lines", [0, first_index, separator_index, True, lines]]]
+        if not modified:
+            calls.append(["nvim_command", ["setlocal nomodified"]])
+        self.nvim.api.call_atomic(calls)
+        self._replace_in_snapshot(project, lines)
+        self._refresh_parsed_buffer()
+        self._refresh_folds()
+        self._refresh_highlights()
+
+    def _project_content(self, project: "Project") -> List[str]:
+        todoist = self._get_todoist()
+        tasks = todoist.tasks_by_project.get(project.id, [])
+        if todoist.is_expanded(project):
+            return [str(task) for task in tasks]
+        return [str(CollapsedTasks(len(tasks)))]
+
+    def _replace_in_snapshot(self, project: "Project", lines: List[str]):
+        snapshot = self.parsed_buffer_since_last_save
+        separator_index = snapshot.get_project_separator_index(project)
+        if separator_index is None:
+            return
+        header_index = snapshot.get_project_line_index_above(separator_index)
+        # The items of the other lines are kept: rendering and parsing them again
+        # would lose the changes made to them since the last save.
+        self.parsed_buffer_since_last_save = snapshot.replace_lines(
+            header_index + 2, separator_index, lines
+        )
+
+    def _refresh_folds(self):
+        # The tasks of every expanded project get a manual fold, all created in a
+        # single round-trip (instead of evaluating a `foldexpr` for every line).
+        if self._get_todoist().expanded_projects is None:
+            return
+        calls = [
+            ["nvim_command", ["setlocal foldmethod=manual"]],
+            ["nvim_command", ["normal! zE"]],
+        ]
+        for header_index in self.parsed_buffer.get_project_line_indices():
+            project = self.parsed_buffer[header_index]
+            separator_index = self.parsed_buffer.get_project_separator_index(project)
+            if separator_index is None or separator_index <= header_index + 2:
+                continue
+            if isinstance(self.parsed_buffer[header_index + 2], CollapsedTasks):
+                continue
+            # Line numbers are 1-based: these are the task lines.
+            calls.append(
+                ["nvim_command", [f"{header_index + 3},{separator_index}fold"]]
+            )
+        calls.append(["nvim_command", ["normal! zR"]])
+        self.nvim.api.call_atomic(calls)
+
+    @pynvim.command("TodoistArchive", sync=True)
+    @instrumented
+    def todoist_archive(self, args):
+        """Open a read-only buffer listing the completed tasks."""
+        if self._archive_buffer is not None and self._archive_buffer.valid:
+            self.nvim.current.buffer = self._archive_buffer
+            return
+        if self.archive is None:
+            self.archive = CompletedArchive(self._get_todoist().api.completed.get_all)
+        self.nvim.command("noswapfile enew")
+        self.nvim.command(
+            "setlocal buftype=nofile bufhidden=hide nomodifiable "
+            "filetype=todoistarchive"
+        )
+        self.nvim.command("file .todoist-archive")
+        self._archive_buffer = self.nvim.current.buffer
+        self._archive_page_lengths = []
+        self._archive_filled_pages = set()
+        # Filling the first screen. The next pages are fetched when scrolling.
+        self._refresh_archive(1, self.nvim.api.win_get_height(0))
+
+    @pynvim.function("TodoistArchiveScrolled", sync=False)
+    @instrumented
+    def todoist_archive_scrolled(self, args):
+        """Called on `WinScrolled`, with the first and last visible lines of the
+        archive."""
+        top, bottom = args
+        self._refresh_archive(top, bottom)
+
+    def _refresh_archive(self, top: int, bottom: int):
+        # Only the pages within a few screens of the visible lines are filled. The
+        # other ones are blanked, keeping their lines so that the scrolling position
+        # doesn't move, and filled again from the archive's cache when scrolled back.
+        page_size = self.archive.page_size
+        first_page = max(0, top - 1 - VIEWPORT_MARGIN) // page_size
+        last_page = (bottom - 1 + VIEWPORT_MARGIN) // page_size
+        buffer = self._archive_buffer.number
+        calls = []
+
+        def set_lines(index: int, lines: List[str]):
+            start = index * page_size
+            end = start + self._archive_page_lengths[index]
+            calls.append(["nvim_buf_set_lines", [buffer, start, end, False, lines]])
+
+        for index in sorted(self._archive_filled_pages):
+            if not first_page <= index <= last_page:
+                set_lines(index, [""] * self._archive_page_lengths[index])
+                self._archive_filled_pages.discard(index)
+        for index in range(first_page, last_page + 1):
+            if index in self._archive_filled_pages:
+                continue
+            if index < len(self._archive_page_lengths):
+                # The history may have changed since: the page keeps its length.
+                length = self._archive_page_lengths[index]
+                lines = [
+                    self.archive.render(item) for item in self.archive.get_page(index)
+                ]
+                set_lines(index, (lines + [""] * length)[:length])
+            elif self.archive.has_page(index):
+                page = self.archive.get_page(index)
+                lines = [self.archive.render(item) for item in page]
+                start = index * page_size
+                # The new buffer holds a single empty line, which is replaced.
+                end = start if start > 0 else -1
+                calls.append(["nvim_buf_set_lines", [buffer, start, end, False, lines]])
+                self._archive_page_lengths.append(len(lines))
+            else:
+                break
+            self._archive_filled_pages.add(index)
+        if not calls:
+            return
+        self.nvim.api.call_atomic(
+            [
+                ["nvim_buf_set_option", [buffer, "modifiable", True]],
+                *calls,
+                ["nvim_buf_set_option", [buffer, "modifiable", False]],
+            ]
+        )
+
+    @pynvim.command("TodoistStats", sync=True)
+    def todoist_stats(self, args):
+        self.echo("\n".join(self.stats.summary()))
+
     @pynvim.function("TodoistCleanup", sync=True)
+    @instrumented
     def todoist_cleanup(self, args):
         """Delete the tasks that are empty."""
         # TODO: redistribute the child-orders if there are clashes.
-        for task in self.todoist.tasks:
+        todoist = self._get_todoist()
+        for task in todoist.tasks:
             if task.content == "":
                 task.delete()
-        self.todoist.commit()
+        todoist.commit()
         self.load_tasks([])
 
     @pynvim.function("LoadTasks", sync=True)
+    @instrumented
     def load_tasks(self, args):
         # Creating or loading the buffer.
         if not self._todoist_buffer_exists():
@@ -226,8 +872,15 @@ class Plugin(object):
         buf_index, line_index, col_index, offset, _ = self.nvim.api.eval("position")
 
         # Actually writing the tasks.
-        self.todoist.sync()
-        self.nvim.current.buffer[:] = [str(item) for item in self.todoist]
+        self._sync_unless_prefetched()
+        self.pending_remote_changes = None
+        self._render_generation += 1
+        if len(self._get_todoist().tasks_by_id) > VIEWPORT_THRESHOLD:
+            # Large workspaces are written progressively, starting with what's on
+            # screen, so that Neovim stays responsive.
+            self._render_progressively((line_index, col_index))
+            return
+        self.nvim.current.buffer[:] = [str(item) for item in self._get_todoist()]
 
         # Restoring the cursor position.
         # We need to be mindful of the case where there were changes on the Todoist
@@ -243,15 +896,88 @@ class Plugin(object):
         self.parsed_buffer_since_last_save = None  # Prevents remote updated.
         self.nvim.api.command("w!")
         self.parsed_buffer_since_last_save = ParsedBuffer(
-            self._get_buffer_content(), self.todoist
+            self._get_buffer_content(), self._get_todoist()
         )
         self._refresh_parsed_buffer()
+        self._refresh_folds()
         self._setup_highlight_groups()
         self._refresh_highlights()
 
         # Emiting a message to confirm.
         self.nvim.command("echo 'Tasks loaded successfully.'")
 
+    def _render_progressively(self, cursor: Tuple[int, int]):
+        # Saves and remote updates are ignored until the whole buffer is written.
+        self.parsed_buffer_since_last_save = None
+        stream = RenderStream(
+            generation=self._render_generation,
+            buffer=self.nvim.current.buffer.number,
+            items=iter(self._get_todoist()),
+            cursor=cursor,
+            lines=[],
+        )
+        self._setup_highlight_groups(self._get_todoist().projects)
+        first_paint_size = self.nvim.api.win_get_height(0) + VIEWPORT_MARGIN
+        self._render_chunk(stream, first_paint_size)
+
+    def _render_chunk(self, stream: RenderStream, size: int):
+        if stream.generation != self._render_generation:
+            # Another `load_tasks` started in the meantime.
+            return
+        start = len(stream.lines)
+        chunk = list(islice(stream.items, size))
+        lines = [str(item) for item in chunk]
+        stream.lines.extend(lines)
+        is_last_chunk = len(chunk) < size
+
+        buffer = stream.buffer
+        calls = [
+            ["nvim_buf_set_option", [buffer, "modifiable", True]],
+            ["nvim_buf_set_lines", [buffer, start, -1, False, lines]],
+        ]
+        # The highlights follow the chunks, as long as the buffer isn't large enough
+        # to only be highlighted around the viewport.
+        if start == 0:
+            namespace = self._get_highlight_namespace()
+            calls.append(["nvim_buf_clear_namespace", [buffer, namespace, 0, -1]])
+        if start < VIEWPORT_THRESHOLD:
+            calls.extend(self._highlight_calls(chunk, start, stream.project, buffer))
+        for item in chunk:
+            if isinstance(item, Project):
+                stream.project = item
+
+        # The cursor is put back as soon as its line exists.
+        line, col = stream.cursor
+        if not stream.cursor_is_restored and (
+            len(stream.lines) >= line or is_last_chunk
+        ):
+            stream.cursor_is_restored = True
+            if start == 0 or self.nvim.current.buffer.number == buffer:
+                line = max(1, min(line, len(stream.lines)))
+                calls.append(["nvim_win_set_cursor", [0, [line, max(0, col - 1)]]])
+        if not is_last_chunk:
+            # The buffer can't be edited while it's incomplete.
+            calls.append(["nvim_buf_set_option", [buffer, "modifiable", False]])
+        self.nvim.api.call_atomic(calls)
+
+        if is_last_chunk:
+            self._finish_rendering(stream)
+        else:
+            self.nvim.async_call(self._render_chunk, stream, RENDER_CHUNK_SIZE)
+
+    def _finish_rendering(self, stream: RenderStream):
+        todoist = self._get_todoist()
+        self.parsed_buffer_since_last_save = ParsedBuffer(stream.lines, todoist)
+        self.parsed_buffer = ParsedBuffer(stream.lines, todoist)
+        # The lines were just rendered: they are well formatted.
+        self._formatted_lines = set(stream.lines)
+        # The buffer matches Todoist, there is nothing to save.
+        self.nvim.api.buf_set_option(stream.buffer, "modified", False)
+        if self.nvim.current.buffer.number == stream.buffer:
+            self._refresh_folds()
+            self._refresh_highlights()
+        self.echo("Tasks loaded successfully.")
+
     def _todoist_buffer_exists(self):
         for i, buffer in enumerate(self.nvim.buffers):
             filepath = Path(buffer.name)
@@ -278,37 +1004,92 @@ class Plugin(object):
     def _get_number_of_lines(self):
         return self.nvim.current.buffer.api.line_count()
 
-    def _setup_highlight_groups(self):
-        for i, item in enumerate(self.parsed_buffer):
+    def _setup_highlight_groups(self, items: Iterable = None):
+        if items is None:
+            items = self.parsed_buffer
+        commands = []
+        for item in items:
             if isinstance(item, Project):
                 # Setting up color for the project's name itself
                 # TODO: have a function returning this group_name. The naming logic
                 # should be centralized.
                 group_name = f"Project{sanitize_str(item.name)}"
-                self.nvim.api.command(
+                commands.append(
                     f"highlight {group_name} "
                     f"cterm=bold gui=bold "
                     f"guifg={item.rgbcolor}"
                 )
                 # Setting up color for the project's tasks
                 group_name = f"Tasks{sanitize_str(item.name)}"
-                self.nvim.api.command(
+                commands.append(
                     f"highlight {group_name} " f"gui=NONE " f"guifg={item.rgbcolor}"
                 )
                 # Adding a specific case for when the task is completed.
                 group_name = f"TasksComplete{sanitize_str(item.name)}"
-                self.nvim.api.command(
+                commands.append(
                     f"highlight {group_name} "
                     f"cterm=strikethrough gui=strikethrough "
                     f"guifg={item.rgbcolor}"
                 )
-
-    def _refresh_highlights(self):
-        highlight_group, highlight_group_suffix = None, None
-        for i, item in enumerate(self.parsed_buffer):
-            # We read the buffer from top to bottom. Every time we encounter a project,
-            # all subsequent items get assigned to its color. Until we find another
-            # project.
+        self.nvim.api.call_atomic([["nvim_command", [command]] for command in commands])
+
+    def _get_highlight_namespace(self) -> int:
+        if self._highlight_namespace is None:
+            self._highlight_namespace = self.nvim.api.create_namespace("pytodoist")
+        return self._highlight_namespace
+
+    @pynvim.function("TodoistViewportChanged", sync=False)
+    @instrumented
+    def viewport_changed(self, args):
+        """Called on `WinScrolled`, with the first and last visible lines."""
+        if self.parsed_buffer is None or not self._is_virtualized():
+            return
+        top, bottom = args
+        if self._highlighted_range is not None:
+            parsed_buffer, start, end = self._highlighted_range
+            if parsed_buffer is self.parsed_buffer and start < top and bottom <= end:
+                # Still within the margin.
+                return
+        self._refresh_highlights(viewport=(top, bottom))
+
+    def _is_virtualized(self) -> bool:
+        return len(self.parsed_buffer.items) > VIEWPORT_THRESHOLD
+
+    def _refresh_highlights(self, viewport: Tuple[int, int] = None):
+        # All the highlights are replaced in a single round-trip. In long buffers,
+        # only the lines around the viewport are highlighted, so that the cost
+        # doesn't depend on the size of the buffer.
+        namespace = self._get_highlight_namespace()
+        start, end = 0, len(self.parsed_buffer.items)
+        if self._is_virtualized():
+            if viewport is None:
+                viewport = self.nvim.api.eval("[line('w0'), line('w$')]")
+            top, bottom = viewport
+            start = max(0, top - 1 - VIEWPORT_MARGIN)
+            end = min(end, bottom + VIEWPORT_MARGIN)
+        # The highlights of the previous refresh are all cleared, wherever the edits
+        # since moved them: there are never more than the lines of a single range.
+        calls = [["nvim_buf_clear_namespace", [0, namespace, 0, -1]]]
+        calls.extend(
+            self._highlight_calls(
+                self.parsed_buffer.items[start:end],
+                start,
+                self.parsed_buffer.get_project_above(start),
+            )
+        )
+        self.nvim.api.call_atomic(calls)
+        self._highlighted_range = (self.parsed_buffer, start, end)
+
+    def _highlight_calls(
+        self, items: Iterable, start: int, project: Optional["Project"], buffer: int = 0
+    ) -> List[list]:
+        # Every item gets assigned the color of the project above it.
+        namespace = self._get_highlight_namespace()
+        calls = []
+        highlight_group_suffix = None
+        if project is not None:
+            highlight_group_suffix = sanitize_str(project.name)
+        for i, item in enumerate(items, start):
             if isinstance(item, Project):
                 highlight_group_suffix = sanitize_str(item.name)
 
@@ -318,7 +1099,13 @@ class Plugin(object):
                 highlight_group = f"TasksComplete{highlight_group_suffix}"
             else:
                 highlight_group = f"Tasks{highlight_group_suffix}"
-            self.nvim.current.buffer.add_highlight(highlight_group, i, 0, -1)
+            calls.append(
+                [
+                    "nvim_buf_add_highlight",
+                    [buffer, namespace, highlight_group, i, 0, -1],
+                ]
+            )
+        return calls
 
     def echo(self, message: str):
         # Type `:help nvim_echo` for more info about the args.
@@ -400,7 +1187,7 @@ class Project:
 class Label:
     def __init__(self, name: str = None, data: todoist.models.Label = None):
         assert name is not None or data is not None
-        self.content = name
+        self.name = name
         self.data = data
 
         if data is not None and name is None:
@@ -449,6 +1236,8 @@ class Task:
         self.data = data
         self.labels = labels
         self.depth = 0
+        # The task this one is displayed under, if any. See `itertasks`.
+        self.parent = None
         self.is_complete = is_complete
         if children is None:
             self.children = []
@@ -463,20 +1252,26 @@ class Task:
         # [x] A task
         # [X] A task
         # A task
+        # Any of them can be indented (by 4 spaces or a tab per level) to denote a
+        # sub-task.
         if isinstance(line, Task):
             return line
+        indent = r"(?P<indent>[ \t]*)"
         checkbox = r"(\[(?P<status>x|X| )\] )?"
         content = r"(?P<content>.*)"
         labels = r"(?P<label>@\w+)*"
         # TODO: removing the label display for now.
         # pattern = rf"^{checkbox}{content}( | {labels})?$"
-        pattern = rf"^{checkbox}{content}$"
+        pattern = rf"^{indent}{checkbox}{content}$"
         match_results = re.match(pattern, line)
 
         status = match_results.group("status")
         content = match_results.group("content")
 
-        return Task(content=content, is_complete=status in ["x", "X"])
+        task = Task(content=content, is_complete=status in ["x", "X"])
+        indent = match_results.group("indent").replace("\t", "    ")
+        task.depth = (len(indent) + 3) // 4
+        return task
 
     @property
     def id(self):
@@ -508,6 +1303,30 @@ class Task:
     def labels(self, labels):
         self.__labels = labels
 
+    @property
+    def project_id(self):
+        if isinstance(self.data, todoist.models.Item):
+            return self.data["project_id"]
+        return self.data.get("project_id")
+
+    @property
+    def priority(self):
+        if isinstance(self.data, todoist.models.Item):
+            return self.data.data.get("priority", 1)
+        return self.data.get("priority", 1)
+
+    @property
+    def due_date(self) -> Optional[str]:
+        # The Todoist API gives the due date as an ISO string, optionally followed by
+        # a time. We only keep the date part.
+        if isinstance(self.data, todoist.models.Item):
+            due = self.data.data.get("due")
+        else:
+            due = self.data.get("due")
+        if due is None:
+            return None
+        return due["date"][:10]
+
     def __repr__(self) -> str:
         short_content = (
             self.content if len(self.content) < 50 else f"{self.content[:47]}..."
@@ -573,15 +1392,76 @@ class Task:
 
 
 class CustomSection:
-    def __init__(self, name: str, filter_fn: Callable[[Task], bool]):
+    def __init__(
+        self,
+        name: str,
+        filter_fn: Callable[[Task], bool] = None,
+        labels: List[str] = None,
+        project: str = None,
+        priority: Union[int, Iterable[int]] = None,
+        due: Tuple[Optional[str], Optional[str]] = None,
+    ):
+        """A section gathering tasks from all projects.
+
+        The content of a section can either be described by an arbitrary `filter_fn`
+        or declaratively, with a combination of:
+        - `labels`: names of labels that the task must all carry.
+        - `project`: name of the project that the task belongs to.
+        - `priority`: a priority (or a list of priorities) from 1 to 4.
+        - `due`: a `(start, end)` range of ISO dates, bounds included. Either bound
+          can be None.
+        The declarative form is resolved through the indexes that
+        `TodoistInterface` maintains at sync time. If both forms are given,
+        `filter_fn` is applied on top of the declarative filter.
+        """
         self.name = name
         self.filter_fn = filter_fn
+        self.labels = labels
+        self.project = project
+        if isinstance(priority, int):
+            priority = [priority]
+        self.priority = None if priority is None else set(priority)
+        self.due = due
 
     def __str__(self):
         return self.name
 
+    def lookup(self, todoist: "TodoistInterface") -> Optional[Set]:
+        """Return the ids of the candidate tasks, using the interface indexes.
+
+        Returns None when the section can't be narrowed down by an index, in which
+        case every task is a candidate."""
+        candidates = None
+        if self.labels is not None:
+            for label_name in self.labels:
+                label = todoist.get_label_by_name(label_name)
+                if label is None:
+                    return set()
+                ids = todoist.task_ids_by_label.get(label.id, set())
+                candidates = set(ids) if candidates is None else candidates & ids
+        if self.project is not None:
+            project = todoist.get_project_by_name(self.project)
+            if project is None:
+                return set()
+            ids = {task.id for task in todoist.tasks_by_project.get(project.id, [])}
+            candidates = ids if candidates is None else candidates & ids
+        if self.priority is not None:
+            ids = set().union(
+                *(todoist.task_ids_by_priority.get(p, set()) for p in self.priority)
+            )
+            candidates = ids if candidates is None else candidates & ids
+        if self.due is not None:
+            ids = set(todoist.get_task_ids_due(*self.due))
+            candidates = ids if candidates is None else candidates & ids
+        return candidates
+
     def matches(self, task: Task):
-        return self.filter_fn(task)
+        """Check the criteria that can't be answered by the interface indexes.
+
+        This is applied on the candidates returned by `lookup`."""
+        if self.filter_fn is not None:
+            return self.filter_fn(task)
+        return True
 
 
 class SectionUnderline:
@@ -606,27 +1486,406 @@ class ProjectUnderline:
         return "=" * len(self.project_name)
 
 
+class TrigramIndex:
+    """Fuzzy search over task contents.
+
+    Every task content is split into lowercase trigrams. A query is answered by
+    counting, for each task, how many trigrams of the query it shares."""
+
+    def __init__(self):
+        self._contents = dict()
+        # The tasks of every trigram, in the order they were indexed (the values are
+        # unused).
+        self._postings = defaultdict(dict)
+
+    def __len__(self):
+        return len(self._contents)
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        text = f"  {text.lower()} "
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def update(self, tasks: Iterable[Task]):
+        # Only the tasks that were added, edited or removed since the last call are
+        # (re-)indexed.
+        contents = {task.id: task.content.lower() for task in tasks}
+        for task_id in self._contents.keys() - contents.keys():
+            self._remove(task_id)
+        for task_id, content in contents.items():
+            previous_content = self._contents.get(task_id)
+            if previous_content == content:
+                continue
+            if previous_content is not None:
+                self._remove(task_id)
+            self._contents[task_id] = content
+            for trigram in self.trigrams(content):
+                self._postings[trigram][task_id] = None
+
+    def _remove(self, task_id):
+        for trigram in self.trigrams(self._contents.pop(task_id)):
+            postings = self._postings[trigram]
+            postings.pop(task_id, None)
+            if not postings:
+                del self._postings[trigram]
+
+    def search(self, query: str, limit: int = 50, max_candidates: int = 1000) -> List:
+        """Return the ids of the tasks best matching `query`, best match first."""
+        query = query.strip().lower()
+        if query == "":
+            return []
+        postings = sorted(
+            (self._postings.get(trigram, {}) for trigram in self.trigrams(query)),
+            key=len,
+        )
+        # We only keep the tasks sharing at least half of the query trigrams. Such a
+        # task is in one of the `len(postings) - min_score + 1` rarest posting lists:
+        # the candidates are taken from them, rarest first, so that the best matches
+        # are always considered. A short or common query can match most tasks: we
+        # then stop at `max_candidates`, in the order the tasks were indexed.
+        min_score = (len(postings) + 1) // 2
+        candidates = dict()
+        for posting in postings[: len(postings) - min_score + 1]:
+            remaining = max_candidates - len(candidates)
+            candidates.update(dict.fromkeys(islice(posting, remaining)))
+
+        scores = Counter()
+        for posting in postings:
+            if len(posting) < len(candidates):
+                scores.update(filter(candidates.__contains__, posting))
+            else:
+                scores.update(filter(posting.__contains__, candidates))
+
+        # We go through the candidates by decreasing score. Within a score, exact
+        # substring matches are ranked first, then shorter contents.
+        tasks_by_score = defaultdict(list)
+        for task_id, score in scores.items():
+            tasks_by_score[score].append(task_id)
+
+        def rank(task_id):
+            content = self._contents[task_id]
+            return (query not in content, len(content))
+
+        results = []
+        for score in range(len(postings), min_score - 1, -1):
+            remaining = limit - len(results)
+            if remaining <= 0:
+                break
+            results.extend(heapq.nsmallest(remaining, tasks_by_score[score], key=rank))
+        return results
+
+
+@DeferredClass
+def HttpSession():
+    class HttpSession(requests.Session):
+        """A session with default timeouts.
+
+        `requests` waits forever by default: a stalled connection would block the
+        editor on save. Connections are kept alive and responses compressed, as with
+        any `requests.Session`."""
+
+        def __init__(self, timeout=HTTP_TIMEOUT):
+            super().__init__()
+            self.timeout = timeout
+
+        def request(self, *args, **kwargs):
+            kwargs.setdefault("timeout", self.timeout)
+            return super().request(*args, **kwargs)
+
+    return HttpSession
+
+
+@functools.lru_cache(maxsize=None)
+def scratch_directory() -> Path:
+    """A private temporary directory for this process, removed when it exits."""
+    path = Path(tempfile.mkdtemp(prefix=f"pytodoist-{os.getpid()}-"))
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+@contextlib.contextmanager
+def file_lock(path: Union[str, Path]):
+    """Exclusive lock on `path`, shared between processes (through a `.lock` file
+    next to it)."""
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open("a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def private_directory(path: Union[str, Path]) -> Path:
+    """Create the directory `path` if needed, and check that only the current user
+    can access it: in a shared directory such as `/tmp`, another user could create
+    our files first."""
+    path = Path(path)
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    status = os.lstat(path)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or status.st_mode & 0o077
+    ):
+        raise PermissionError(
+            f"{path} must be a directory private to the current user."
+        )
+    return path
+
+
+def atomic_write(path: Union[str, Path], content: str):
+    """Replace the content of `path` so that readers see either the old or the new
+    content, never a mix of both."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@DeferredClass
+def CachedTodoistAPI():
+    class CachedTodoistAPI(todoist.api.TodoistAPI):
+        """`TodoistAPI` whose cache can be shared by several Neovim instances: it is
+        read and written under a lock, and written atomically."""
+
+        def _cache_path(self, extension: str) -> str:
+            return self.cache + self.token + extension
+
+        def _read_cache(self):
+            if not self.cache:
+                return
+            os.makedirs(self.cache, exist_ok=True)
+            with file_lock(self._cache_path(".json")):
+                super()._read_cache()
+
+        def _write_cache(self):
+            if not self.cache:
+                return
+            result = json.dumps(
+                self.state, indent=2, sort_keys=True, default=todoist.api.state_default
+            )
+            with file_lock(self._cache_path(".json")):
+                atomic_write(self._cache_path(".json"), result)
+                atomic_write(self._cache_path(".sync"), self.sync_token)
+
+    return CachedTodoistAPI
+
+
+class CommandJournal:
+    """Append-only, fsync'd log of the sync commands not yet applied by Todoist.
+
+    Commands are journaled before being sent, and marked as applied once Todoist
+    acknowledged them. Whatever is left in the journal (because the network was
+    down, or Neovim was closed) is replayed in order on the next commit or sync.
+    Todoist deduplicates commands by uuid, so a command that was applied but not
+    yet marked as such can safely be sent again.
+
+    Several Neovim instances can share the journal: it is only written under a file
+    lock, and reloaded before being compacted so that the commands of the other
+    instances aren't dropped."""
+
+    # Arguments that can hold the temporary id of an object created offline.
+    ID_ARGS = ["id", "project_id", "parent_id", "section_id", "item_id"]
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path).expanduser()
+        self.pending = OrderedDict()
+        self.temp_ids = dict()
+        self._load()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _load(self):
+        self.pending = OrderedDict()
+        self.temp_ids = dict()
+        if not self.path.exists():
+            return
+        for line in self.path.read_text().splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last record can be truncated if we crashed while writing it.
+                continue
+            self._apply(record)
+
+    def _apply(self, record: dict):
+        if record["op"] == "command":
+            self.pending[record["command"]["uuid"]] = record["command"]
+        elif record["op"] == "applied":
+            self.pending.pop(record["uuid"], None)
+        elif record["op"] == "temp_id":
+            self.temp_ids[record["temp_id"]] = record["id"]
+
+    def _append(self, records: List[dict]):
+        if not records:
+            return
+        for record in records:
+            self._apply(record)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path), self.path.open("a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, commands: List[dict]):
+        self._append([{"op": "command", "command": command} for command in commands])
+
+    def acknowledge(self, uuids: Iterable[str], temp_id_mapping: dict):
+        self._append(
+            [
+                *[
+                    {"op": "temp_id", "temp_id": temp_id, "id": new_id}
+                    for temp_id, new_id in temp_id_mapping.items()
+                ],
+                *[{"op": "applied", "uuid": uuid} for uuid in uuids],
+            ]
+        )
+        if not self.pending:
+            self.compact()
+
+    def compact(self):
+        # Nothing is pending anymore: we start over with an empty journal. Another
+        # instance may have journaled commands in the meantime, so the journal is
+        # reloaded first. The truncation goes through a rename so that it is atomic.
+        if not self.path.exists():
+            return
+        with file_lock(self.path):
+            self._load()
+            if self.pending:
+                return
+            atomic_write(self.path, "")
+            self.temp_ids = dict()
+
+    def pending_commands(self) -> List[dict]:
+        commands = []
+        for command in self.pending.values():
+            command = dict(command, args=dict(command["args"]))
+            for key in self.ID_ARGS:
+                if command["args"].get(key) in self.temp_ids:
+                    command["args"][key] = self.temp_ids[command["args"][key]]
+            commands.append(command)
+        return commands
+
+
 class TodoistInterface:
     def __init__(
         self,
         todoist_api: todoist.api.TodoistAPI,
         custom_sections: List[CustomSection] = None,
+        journal: CommandJournal = None,
+        project_names: Iterable[str] = None,
     ):
         self.api = todoist_api
+        self.journal = journal
+        self.is_offline = False
         self.tasks = None
         self.projects = None
+        self.labels = None
+        self.labels_by_name = dict()
+        self.labels_by_id = dict()
+        self._projects_by_name = dict()
+        self._tasks_by_content = dict()
+        # Indexes maintained at sync time. See `_index_tasks`.
+        self.tasks_by_id = dict()
+        self.tasks_by_project = dict()
+        self.task_ids_by_label = dict()
+        self._task_ranks = dict()
+        self.search_index = TrigramIndex()
         if custom_sections is None:
             custom_sections = []
         self.custom_sections = custom_sections
+        # Ids of the projects whose tasks are rendered. `None` means all of them.
+        self.expanded_projects = None
+        # The workspace can be restricted to some projects and their sub-projects.
+        # Tasks of the other projects are never wrapped, rendered nor diffed.
+        self.project_names = None
+        if project_names is not None:
+            self.project_names = {name.lower() for name in project_names}
+        self.project_ids = None
+
+    @classmethod
+    def from_token(
+        cls,
+        token: str,
+        api_endpoint: str = API_ENDPOINT,
+        timeout=HTTP_TIMEOUT,
+        cache: Optional[str] = "~/.todoist-sync/",
+        journal: CommandJournal = None,
+        **kwargs,
+    ) -> "TodoistInterface":
+        session = HttpSession(timeout=timeout)
+        api = CachedTodoistAPI(
+            token, api_endpoint=api_endpoint, session=session, cache=cache
+        )
+        return cls(api, journal=journal, **kwargs)
+
+    @property
+    def session(self) -> requests.Session:
+        return self.api.session
 
     def sync(self):
-        self.api.sync()
+        if self.journal is not None and len(self.journal) > 0:
+            self.replay_journal()
+        try:
+            self.api.sync()
+        except requests.RequestException:
+            if self.journal is None:
+                raise
+            # We keep working on the local state until the network is back.
+            self.is_offline = True
+        self._init_state()
+
+    def _init_state(self):
         self.labels = self._init_labels()
         self.projects = self._init_projects()
         self.tasks = self._init_tasks()
+        self._index_tasks()
+
+    def fetch_changes(self) -> Tuple[str, dict]:
+        """Fetch the changes since the last sync, without applying them. This is safe
+        to call from another thread."""
+        sync_token = self.api.sync_token
+        post_data = {
+            "token": self.api.token,
+            "sync_token": sync_token,
+            "resource_types": json.dumps(["all"]),
+            "commands": "[]",
+        }
+        return sync_token, self.api._post("sync", data=post_data)
+
+    def apply_changes(self, sync_token: str, response: dict) -> bool:
+        """Apply changes returned by `fetch_changes`. Returns False if they are
+        outdated, i.e. if the workspace was synced since they were fetched."""
+        if self.api.sync_token != sync_token or "sync_token" not in response:
+            return False
+        self.api._update_state(response)
+        self.api._write_cache()
+        self._init_state()
+        return True
+
+    @staticmethod
+    def has_changes(response: dict) -> bool:
+        return any(
+            response.get(resource_type)
+            for resource_type in ["items", "projects", "labels", "sections"]
+        )
 
     def _init_labels(self):
         labels = [Label(data=item) for item in self.api.state["labels"]]
+        self.labels_by_name = {label.name: label for label in labels}
+        self.labels_by_id = {label.id: label for label in labels}
         return labels
 
     def _init_projects(self):
@@ -634,52 +1893,149 @@ class TodoistInterface:
         projects = [Project(data=item) for item in self.api.state["projects"]]
 
         # Second pass: assigning children.
-        for i, project in enumerate(projects):
-            if project.data["parent_id"] is not None:
-                # Searching for the parent.
-                for parent_project in projects:
-                    if parent_project.id == project.data["parent_id"]:
-                        parent_project.children.append(project)
+        projects_by_id = {project.id: project for project in projects}
+        for project in projects:
+            parent_project = projects_by_id.get(project.data["parent_id"])
+            if parent_project is not None:
+                parent_project.children.append(project)
+
+        if self.project_names is not None:
+            projects = self._select_projects(projects)
+
+        self._projects_by_name = dict()
+        for project in projects:
+            self._projects_by_name.setdefault(project.name.lower(), project)
 
         return projects
 
+    def _select_projects(self, projects: List[Project]) -> List[Project]:
+        self.project_ids = set()
+        for root in projects:
+            if root.name.lower() in self.project_names:
+                self.project_ids.update(
+                    project.id for project in self.iterprojects(root)
+                )
+            elif root.is_inbox:
+                # The Inbox is always kept: tasks added to custom sections land there.
+                self.project_ids.add(root.id)
+        return [project for project in projects if project.id in self.project_ids]
+
     def _init_tasks(self):
         # First pass: not considering the children or anything.
         tasks = [
             Task(
                 data=item,
-                labels=[label for label in self.labels if label.id in item["labels"]],
+                labels=[
+                    self.labels_by_id[label_id]
+                    for label_id in item["labels"]
+                    if label_id in self.labels_by_id
+                ],
             )
             for item in self.api.state["items"]
+            if self.project_ids is None or item["project_id"] in self.project_ids
         ]
 
         # Second pass: assigning children.
-        for i, task in enumerate(tasks):
-            if task.data["parent_id"] is not None:
-                # Searching for the parent.
-                for parent_task in tasks:
-                    if parent_task.id == task.data["parent_id"]:
-                        parent_task.children.append(task)
+        tasks_by_id = {task.id: task for task in tasks}
+        for task in tasks:
+            parent_task = tasks_by_id.get(task.data["parent_id"])
+            if parent_task is not None:
+                parent_task.children.append(task)
 
         return tasks
 
+    def _index_tasks(self):
+        # A single walk of the task tree, in display order, from which we derive all
+        # the lookups needed for rendering.
+        self.tasks_by_id = dict()
+        self.tasks_by_project = defaultdict(list)
+        self.task_ids_by_label = defaultdict(set)
+        self.task_ids_by_priority = defaultdict(set)
+        due_tasks = []
+        for task in self.itertasks():
+            if not task.isvalid():
+                continue
+            self.tasks_by_id[task.id] = task
+            self.tasks_by_project[task.project_id].append(task)
+            for label_id in task.data["labels"]:
+                self.task_ids_by_label[label_id].add(task.id)
+            self.task_ids_by_priority[task.priority].add(task.id)
+            if task.due_date is not None:
+                due_tasks.append((task.due_date, task.id))
+
+        # The due tasks sorted by date, so that a range of dates is found by
+        # bisection. See `get_task_ids_due`.
+        due_tasks.sort()
+        self._due_dates = [due_date for due_date, _ in due_tasks]
+        self._due_task_ids = [task_id for _, task_id in due_tasks]
+
+        # The rank of a task is its position when listing the tasks project by
+        # project. Custom sections use it to preserve the ordering of their results.
+        self._task_ranks = dict()
+        for project in self.iterprojects():
+            for task in self.tasks_by_project.get(project.id, []):
+                self._task_ranks[task.id] = len(self._task_ranks)
+
+        # Several tasks can share a content: they are listed in display order, so
+        # that the lines of a buffer can be matched with them in order.
+        self._tasks_by_content = defaultdict(list)
+        for task_id in self._task_ranks:
+            task = self.tasks_by_id[task_id]
+            self._tasks_by_content[task.content].append(task)
+        for task_id, task in self.tasks_by_id.items():
+            if task_id not in self._task_ranks:
+                self._tasks_by_content[task.content].append(task)
+
+        # Only the tasks whose content changed since the last sync are re-indexed.
+        self.search_index.update(self.tasks_by_id.values())
+
+    def search(self, query: str, limit: int = 50) -> List[Task]:
+        task_ids = self.search_index.search(query, limit=limit)
+        return [self.tasks_by_id[task_id] for task_id in task_ids]
+
+    def get_task_ids_due(self, start=None, end=None) -> List[str]:
+        """Return the ids of the tasks due between `start` and `end` (ISO dates or
+        dates, bounds included). Either bound can be None."""
+        start, end = _isodate(start), _isodate(end)
+        i = 0 if start is None else bisect.bisect_left(self._due_dates, start)
+        j = len(self._due_dates)
+        if end is not None:
+            j = bisect.bisect_right(self._due_dates, end)
+        return self._due_task_ids[i:j]
+
+    def filter_tasks(self, custom_section: CustomSection) -> List[Task]:
+        candidate_ids = custom_section.lookup(self)
+        if candidate_ids is None:
+            candidate_ids = self._task_ranks.keys()
+        tasks = [
+            self.tasks_by_id[task_id]
+            for task_id in candidate_ids
+            if task_id in self._task_ranks
+        ]
+        tasks = [task for task in tasks if custom_section.matches(task)]
+        return sorted(tasks, key=lambda task: self._task_ranks[task.id])
+
     def get_project_by_name(self, project_name):
-        for project in self.projects:
-            if project_name.lower() == project.name.lower():
-                return project
-        return None
+        return self._projects_by_name.get(project_name.lower())
 
-    def get_task_by_content(self, content):
-        for task in self.tasks:
-            if content == task.content:
-                return task
+    def get_task_by_content(self, content, occurrence: int = 0):
+        """Return the task with this content. `occurrence` picks one of the tasks
+        sharing it, in display order."""
+        tasks = self._tasks_by_content.get(content)
+        if not tasks:
+            return None
+        task = tasks[min(occurrence, len(tasks) - 1)]
+        # The content of a task can be altered locally (e.g. when it's completed)
+        # until the next sync.
+        if task is not None and task.content == content:
+            return task
         return None
 
-    def get_label_by_name(self, name):
-        for label in self.api.state["labels"]:
-            if name == label["name"]:
-                return label
-        return None
+    def get_label_by_name(self, name) -> Optional[Label]:
+        return self.labels_by_name.get(name)
+
+    def get_label_by_id(self, label_id) -> Optional[Label]:
+        return self.labels_by_id.get(label_id)
 
     def iterprojects(self, root: Project = None):
         if root is not None:
@@ -690,18 +2046,40 @@ class TodoistInterface:
             for next_project in next_projects:
                 yield from self.iterprojects(next_project)
         else:
-            root_projects = [project for project in self.projects if project.isroot]
+            # When the workspace is restricted, a selected sub-project is displayed
+            # as a root.
+            root_projects = [
+                project
+                for project in self.projects
+                if project.isroot
+                or (
+                    self.project_ids is not None
+                    and project.data["parent_id"] not in self.project_ids
+                )
+            ]
             for project in sorted(
                 root_projects, key=lambda project: project.child_order
             ):
                 yield from self.iterprojects(root=project)
 
-    def itertasks(self, root: Task = None):
+    def itertasks(self, root: Task = None, parent: Task = None):
         if root is not None:
+            # A sub-task is indented under its parent, as long as the parent is
+            # displayed right above it.
+            if (
+                parent is not None
+                and parent.isvalid()
+                and parent.project_id == root.project_id
+            ):
+                root.parent = parent
+                root.depth = parent.depth + 1
+            else:
+                root.parent = None
+                root.depth = 0
             yield root
             next_tasks = sorted(root.children, key=lambda task: task.child_order)
             for next_task in next_tasks:
-                yield from self.itertasks(next_task)
+                yield from self.itertasks(next_task, parent=root)
         else:
             root_tasks = [task for task in self.tasks if task.isroot]
             for task in sorted(root_tasks, key=lambda task: task.child_order):
@@ -713,30 +2091,26 @@ class TodoistInterface:
                 continue
             yield project
             yield ProjectUnderline(project_name=project.name)
-            # TODO: do the filtering, *then* the sorting. Will be faster.
-            # project_tasks = [task for task in self.tasks if task.isin(project)]
-            for task in self.itertasks():
-                if task.isin(project) and task.isvalid():
-                    yield task
+            if self.is_expanded(project):
+                yield from self.tasks_by_project.get(project.id, [])
+            else:
+                yield CollapsedTasks(len(self.tasks_by_project.get(project.id, [])))
             yield ProjectSeparator()
 
-        # We display the custom sections last.
-        # TODO: removing the custom sections for now.
+        # We display the custom sections last. Their tasks aren't indented: their
+        # parents aren't necessarily part of the section.
         for custom_section in self.custom_sections:
             yield custom_section
             yield SectionUnderline(custom_section.name)
-            # In order to preserve task order, we're forced to iterate over projects
-            # once again.
-            for project in self.iterprojects():
-                for task in self.itertasks():
-                    if (
-                        task.isin(project)
-                        and task.isvalid()
-                        and custom_section.matches(task)
-                    ):
-                        yield task
+            for task in self.filter_tasks(custom_section):
+                flat_task = copy(task)
+                flat_task.depth = 0
+                yield flat_task
             yield ProjectSeparator()
 
+    def is_expanded(self, project: Project) -> bool:
+        return self.expanded_projects is None or project.id in self.expanded_projects
+
     def add_task(self, *args, **kwargs):
         # We populate this fields because the `isvalid` function will use it.
         if "is_deleted" not in kwargs.keys():
@@ -754,7 +2128,507 @@ class TodoistInterface:
         return self.api.items.add(*args, **kwargs)
 
     def commit(self):
-        return self.api.commit()
+        if self.journal is None:
+            return self.api.commit()
+        self.journal.append(self.api.queue)
+        del self.api.queue[:]
+        return self.replay_journal()
+
+    def replay_journal(self):
+        response = self.send_journal()
+        if response is None:
+            return None
+        for command_uuid, status in response.get("sync_status", dict()).items():
+            if status != "ok":
+                # Such commands will never succeed. They are not retried.
+                raise todoist.api.SyncError(command_uuid, status)
+        return response
+
+    def send_journal(self) -> Optional[dict]:
+        """Send the pending commands of the journal, and acknowledge them."""
+        commands = self.journal.pending_commands()
+        if not commands:
+            return None
+        try:
+            response = self.api.sync(commands=commands)
+        except requests.RequestException:
+            self.is_offline = True
+            return None
+        if not isinstance(response, dict):
+            # Not an answer from Todoist (e.g. the error page of a proxy). The
+            # commands are kept for the next replay.
+            self.is_offline = True
+            return None
+        if "sync_status" not in response:
+            # The request was rejected as a whole (rate limiting, server error...).
+            self.is_offline = True
+            return response
+
+        self.is_offline = False
+        self.journal.acknowledge(
+            response["sync_status"].keys(), response.get("temp_id_mapping", dict())
+        )
+        return response
+
+
+class CompletedArchive:
+    """The completed tasks, most recent first, fetched page by page.
+
+    Only the pages that are actually displayed are requested. They are kept in an
+    LRU cache, from which the archive buffer fills the pages scrolled back into view:
+    it only holds the pages close to the visible lines (see
+    `Plugin._refresh_archive`). The other pages are left as empty lines, so that the
+    memory used barely grows with the size of the history."""
+
+    def __init__(self, get_all: Callable, page_size: int = 50, max_pages: int = 20):
+        # `get_all` is `TodoistAPI.completed.get_all`.
+        self.get_all = get_all
+        self.page_size = page_size
+        self.max_pages = max_pages
+        # Known once the last page was fetched.
+        self.page_count = None
+        self._pages = OrderedDict()
+
+    def get_page(self, index: int) -> List[dict]:
+        if index in self._pages:
+            self._pages.move_to_end(index)
+            return self._pages[index]
+
+        response = self.get_all(limit=self.page_size, offset=index * self.page_size)
+        if not isinstance(response, dict) or "items" not in response:
+            raise ValueError(f"Can't fetch the completed tasks: {response}")
+        items = response["items"]
+        if len(items) < self.page_size:
+            self.page_count = index + 1
+
+        self._pages[index] = items
+        if len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return items
+
+    def has_page(self, index: int) -> bool:
+        return self.page_count is None or index < self.page_count
+
+    @staticmethod
+    def render(item: dict) -> str:
+        return f"[X] {item['content']} ({item['completed_date'][:10]})"
+
+
+class SyncDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A local server owning a single synced workspace, shared by several Neovim
+    instances through a Unix socket.
+
+    Clients (see `DaemonApi`) speak the Todoist sync protocol: they send their sync
+    token and their commands, and get back the changes since their token. Upstream
+    syncs are shared between clients, commits are serialized (and journaled), and
+    the resulting changes are pushed to the other clients."""
+
+    daemon_threads = True
+    # The resources forwarded to the clients.
+    RESOURCE_TYPES = ["items", "projects", "labels", "sections", "notes"]
+    # The other endpoints available to the clients.
+    FORWARDED_CALLS = ["completed/get_all"]
+
+    def __init__(
+        self,
+        socket_path: Union[str, Path],
+        interface: TodoistInterface,
+        min_sync_interval: float = 1.0,
+        idle_timeout: Optional[float] = None,
+    ):
+        self.socket_path = Path(socket_path)
+        private_directory(self.socket_path.parent)
+        with file_lock(self.socket_path):
+            if self.socket_path.exists():
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    if probe.connect_ex(str(self.socket_path)) == 0:
+                        raise OSError(f"A daemon is already listening on {socket_path}")
+                # A stale socket left by a daemon that didn't exit cleanly.
+                self.socket_path.unlink()
+            super().__init__(str(self.socket_path), SyncDaemonHandler)
+        self.interface = interface
+        self.min_sync_interval = min_sync_interval
+        self.idle_timeout = idle_timeout
+        self.upstream_sync_count = 0
+
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.daemon_id = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.objects = {resource_type: dict() for resource_type in self.RESOURCE_TYPES}
+        # Sequence number of the last change of every object.
+        self.changes = {resource_type: dict() for resource_type in self.RESOURCE_TYPES}
+        self.temp_ids = dict()
+        self.user = dict()
+        self._last_sync = None
+        self._last_activity = time.monotonic()
+        # The workspace loaded from the cache of the upstream client, if any.
+        self._record(
+            {
+                resource_type: [
+                    obj.data for obj in interface.api.state.get(resource_type, [])
+                ]
+                for resource_type in self.RESOURCE_TYPES
+            }
+        )
+
+    @property
+    def sync_token(self) -> str:
+        return f"{self.daemon_id}:{self.sequence}"
+
+    def serve(self):
+        if self.idle_timeout is not None:
+            threading.Thread(target=self._exit_when_idle, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    def _exit_when_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 10))
+            idle_time = time.monotonic() - self._last_activity
+            if not self.clients and idle_time > self.idle_timeout:
+                self.shutdown()
+                return
+
+    def _record(self, response: dict):
+        self.sequence += 1
+        for resource_type in self.RESOURCE_TYPES:
+            for obj in response.get(resource_type, []):
+                self.objects[resource_type][obj["id"]] = obj
+                self.changes[resource_type][obj["id"]] = self.sequence
+        for temp_id, new_id in response.get("temp_id_mapping", dict()).items():
+            self.temp_ids[temp_id] = (self.sequence, new_id)
+        if "user" in response:
+            self.user.update(response["user"])
+
+    def _sync_upstream(self, commands: List[dict] = None) -> Optional[dict]:
+        journal = self.interface.journal
+        if commands:
+            journal.append(commands)
+        response = None
+        if len(journal) > 0:
+            response = self.interface.send_journal()
+        if response is None or "sync_status" not in response:
+            try:
+                response = self.interface.api.sync()
+            except requests.RequestException:
+                return None
+        self.upstream_sync_count += 1
+        self._last_sync = time.monotonic()
+        self._record(response)
+        return response
+
+    def delta(self, sync_token: str) -> dict:
+        daemon_id, _, sequence = sync_token.partition(":")
+        # Tokens issued by another daemon (or "*") get a full sync.
+        full_sync = daemon_id != self.daemon_id
+        since = 0 if full_sync else int(sequence)
+        response = {
+            "sync_token": self.sync_token,
+            "full_sync": full_sync,
+            "user": self.user,
+            "temp_id_mapping": {
+                temp_id: new_id
+                for temp_id, (sequence, new_id) in self.temp_ids.items()
+                if sequence > since
+            },
+        }
+        for resource_type in self.RESOURCE_TYPES:
+            objects = self.objects[resource_type]
+            response[resource_type] = [
+                objects[obj_id]
+                for obj_id, sequence in self.changes[resource_type].items()
+                if sequence > since
+                and not (full_sync and objects[obj_id].get("is_deleted"))
+            ]
+        return response
+
+    def handle_sync(self, client: "SyncDaemonHandler", sync_token: str, commands):
+        self._last_activity = time.monotonic()
+        with self.lock:
+            sequence = self.sequence
+            if commands:
+                upstream_response = self._sync_upstream(commands)
+                if upstream_response is None or "sync_status" not in upstream_response:
+                    # Todoist is unreachable. The commands are journaled and will be
+                    # replayed with the next upstream sync.
+                    sync_status = {command["uuid"]: "ok" for command in commands}
+                else:
+                    sync_status = upstream_response["sync_status"]
+            elif (
+                self._last_sync is None
+                or time.monotonic() - self._last_sync > self.min_sync_interval
+            ):
+                self._sync_upstream()
+            response = self.delta(sync_token)
+            if commands:
+                response["sync_status"] = sync_status
+            client.sync_token = response["sync_token"]
+            has_changed = self.sequence != sequence
+        if has_changed:
+            self.push(exclude=client)
+        return response
+
+    def handle_get(self, call: str, params: dict):
+        # Read-only endpoints are forwarded as is, with the token of the daemon.
+        if call not in self.FORWARDED_CALLS:
+            return {"error": f"Unsupported call: {call}"}
+        self._last_activity = time.monotonic()
+        api = self.interface.api
+        try:
+            return api._get(call, params=dict(params, token=api.token))
+        except requests.RequestException as e:
+            return {"error": str(e)}
+
+    def push(self, exclude: "SyncDaemonHandler" = None):
+        for client in list(self.clients):
+            if client is exclude:
+                continue
+            with self.lock:
+                delta = self.delta(client.sync_token)
+                client.sync_token = delta["sync_token"]
+            client.send({"push": delta})
+
+
+class SyncDaemonHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.sync_token = "*"
+        self._write_lock = threading.Lock()
+        self.server.clients.add(self)
+
+    def finish(self):
+        self.server.clients.discard(self)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            message = json.loads(line)
+            if "get" in message:
+                response = self.server.handle_get(message["get"], message["params"])
+            else:
+                response = self.server.handle_sync(
+                    self, message["sync_token"], message["commands"]
+                )
+            self.send({"response": response})
+
+    def send(self, message: dict):
+        with self._write_lock:
+            try:
+                self.wfile.write(json.dumps(message).encode() + b"\n")
+                self.wfile.flush()
+            except OSError:
+                # The client went away.
+                pass
+
+
+class DaemonConnection:
+    """The client side of the socket of a `SyncDaemon`.
+
+    Pushed changes are accumulated in `pushes`, and `on_push` is called (from the
+    reader thread) every time one arrives. Once the daemon is gone, requests raise
+    `requests.ConnectionError`, like the network would."""
+
+    def __init__(self, socket_path: Union[str, Path], on_push: Callable = None):
+        self.socket_path = socket_path
+        self.on_push = on_push
+        self.pushes = deque()
+        self.is_closed = False
+        private_directory(Path(socket_path).parent)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(str(socket_path))
+            self._check_peer()
+        except OSError:
+            self._socket.close()
+            raise
+        self._responses = queue.Queue()
+        self._request_lock = threading.Lock()
+        threading.Thread(target=self._read_messages, daemon=True).start()
+
+    @classmethod
+    def connect_or_spawn(
+        cls, socket_path: Union[str, Path], on_push: Callable = None, timeout=5.0
+    ) -> "DaemonConnection":
+        try:
+            return cls(socket_path, on_push)
+        except PermissionError:
+            # Spawning a daemon wouldn't help.
+            raise
+        except OSError:
+            pass
+        with file_lock(f"{socket_path}.spawn"):
+            # Another instance may have spawned the daemon while we were waiting.
+            try:
+                return cls(socket_path, on_push)
+            except PermissionError:
+                raise
+            except OSError:
+                pass
+            return cls._spawn(socket_path, on_push, timeout)
+
+    @classmethod
+    def _spawn(
+        cls, socket_path: Union[str, Path], on_push: Callable, timeout: float
+    ) -> "DaemonConnection":
+        subprocess.Popen(
+            [sys.executable, __file__, "daemon", "--socket", str(socket_path)],
+            start_new_session=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return cls(socket_path, on_push)
+            except PermissionError:
+                raise
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _check_peer(self):
+        # Whatever the permissions of the socket, it must be served by a daemon of the
+        # current user.
+        if hasattr(socket, "SO_PEERCRED"):
+            credentials = self._socket.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+            )
+            _, uid, _ = struct.unpack("3i", credentials)
+        else:
+            uid = os.stat(self.socket_path).st_uid
+        if uid != os.getuid():
+            raise PermissionError(f"{self.socket_path} belongs to another user.")
+
+    def _read_messages(self):
+        try:
+            with self._socket.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if "push" in message:
+                        self.pushes.append(message["push"])
+                        if self.on_push is not None:
+                            self.on_push()
+                    else:
+                        self._responses.put(message["response"])
+        except OSError:
+            pass
+        # The daemon went away: a request waiting for its response fails right away.
+        self.is_closed = True
+        self._responses.put(None)
+
+    def request(self, sync_token: str, commands: List[dict]) -> dict:
+        return self._send({"sync_token": sync_token, "commands": commands})
+
+    def get(self, call: str, params: dict) -> dict:
+        return self._send({"get": call, "params": params})
+
+    def _send(self, message: dict) -> dict:
+        with self._request_lock:
+            if self.is_closed:
+                raise requests.ConnectionError(
+                    "The connection to the daemon is closed."
+                )
+            try:
+                self._socket.sendall(json.dumps(message).encode() + b"\n")
+                response = self._responses.get(timeout=HTTP_TIMEOUT[1])
+            except (OSError, queue.Empty) as e:
+                # A late response would be taken for the one of the next request.
+                self.close()
+                raise requests.ConnectionError(f"The daemon didn't answer: {e!r}")
+            if response is None:
+                raise requests.ConnectionError("The daemon closed the connection.")
+            return response
+
+    def close(self):
+        self.is_closed = True
+        self._socket.close()
+
+
+@DeferredClass
+def DaemonApi():
+    class DaemonApi(todoist.api.TodoistAPI):
+        """A Todoist client going through a `SyncDaemon` instead of the network."""
+
+        def __init__(self, connection: DaemonConnection):
+            super().__init__(cache=None)
+            self.connection = connection
+
+        def _apply_response(self, response: dict):
+            for temp_id, new_id in response.get("temp_id_mapping", dict()).items():
+                self.temp_ids[temp_id] = new_id
+                self._replace_temp_id(temp_id, new_id)
+            self._update_state(response)
+
+        def sync(self, commands=None):
+            while self.connection.pushes:
+                self._apply_response(self.connection.pushes.popleft())
+            return super().sync(commands=commands)
+
+        def _post(self, call, url=None, **kwargs):
+            data = kwargs["data"]
+            sync_token, commands = data["sync_token"], json.loads(data["commands"])
+            return self._send(lambda: self.connection.request(sync_token, commands))
+
+        def _get(self, call, url=None, **kwargs):
+            params = dict(kwargs.get("params", dict()))
+            params.pop("token", None)
+            return self._send(lambda: self.connection.get(call, params))
+
+        def _send(self, send: Callable[[], dict]) -> dict:
+            if self.connection.is_closed:
+                self.reconnect()
+                return send()
+            try:
+                return send()
+            except requests.ConnectionError:
+                # The daemon may have died since the last request: we try again once
+                # with another one. Commands carry a uuid: they aren't applied twice.
+                self.reconnect()
+                return send()
+
+        def reconnect(self):
+            """Connect to the daemon again, spawning a new one if needed."""
+            previous = self.connection
+            previous.close()
+            try:
+                self.connection = DaemonConnection.connect_or_spawn(
+                    previous.socket_path, on_push=previous.on_push
+                )
+            except OSError as e:
+                raise requests.ConnectionError(f"Can't reach the daemon: {e!r}")
+            # The pushes of the previous daemon are dropped: our sync token lags
+            # behind, so the next sync brings their changes anyway.
+
+    return DaemonApi
+
+
+class CollapsedTasks:
+    """Stands for the tasks of a collapsed project."""
+
+    REGEX = re.compile(r"^\[\+\] (?P<count>\d+) tasks?$")
+
+    def __init__(self, count: int):
+        self.count = count
+
+    @classmethod
+    def parse(cls, line: str) -> Optional["CollapsedTasks"]:
+        matches = cls.REGEX.match(line)
+        if matches is None:
+            return None
+        return cls(int(matches.group("count")))
+
+    def __repr__(self):
+        return f"CollapsedTasks({self.count})"
+
+    def __str__(self):
+        return f"[+] {self.count} task{'s' if self.count != 1 else ''}"
 
 
 class ProjectSeparator:
@@ -769,9 +2643,21 @@ class ProjectSeparator:
 
 
 class ParsedBuffer:
+    # Items parsed from a single line, shared by all the snapshots of the buffer that
+    # contain this line: between two snapshots, most lines don't change. They must
+    # not be mutated (see `get_item_for_update`). Entries go away with the last
+    # snapshot using them.
+    _items_by_line = weakref.WeakValueDictionary()
+
     def __init__(self, lines: List[str], todoist: TodoistInterface = None):
-        self._raw_lines = lines
+        # Interned, so that the snapshots share the strings of their common lines.
+        self._raw_lines = [sys.intern(line) for line in lines]
         self.todoist = todoist
+        self._task_line_indices = None
+        self._project_separator_indices = None
+        self._project_line_indices = None
+        self._lines = None
+        self._line_hashes = None
 
         self.items = self.parse_lines()
         if self.todoist is not None:
@@ -815,20 +2701,35 @@ class ParsedBuffer:
                 k += 2
                 continue
 
-            # The remaining possibilities are: a proper task or a ProjectSeparator.
-            item = Task.parse(line) if line.strip() != "" else ProjectSeparator()
-            items.append(item)
+            items.append(self._parse_line(line))
             k += 1
         return items
 
+    @classmethod
+    def _parse_line(cls, line: str):
+        item = cls._items_by_line.get(line)
+        if item is None:
+            # The remaining possibilities are: the placeholder of a collapsed project,
+            # a proper task or a ProjectSeparator.
+            item = CollapsedTasks.parse(line)
+            if item is None:
+                item = Task.parse(line) if line.strip() != "" else ProjectSeparator()
+            cls._items_by_line[line] = item
+        return item
+
     def fill_items_with_data(self):
+        # The n-th line of a content is matched with the n-th task having it.
+        occurrences = Counter()
         for i, item in enumerate(self.items):
             if isinstance(item, Project):
                 project = self.todoist.get_project_by_name(item.name)
                 if project is not None:
                     self.items[i] = project
             elif isinstance(item, Task):
-                task = self.todoist.get_task_by_content(item.content)
+                task = self.todoist.get_task_by_content(
+                    item.content, occurrences[item.content]
+                )
+                occurrences[item.content] += 1
                 if task is not None:
                     task_in_buffer_is_marked_as_complete = self.items[i].is_complete
                     self.items[i] = task
@@ -842,6 +2743,82 @@ class ParsedBuffer:
     def __getitem__(self, i):
         return self.items[i]
 
+    def replace_lines(self, start: int, end: int, lines: List[str]) -> "ParsedBuffer":
+        """A copy of this buffer where the lines `start` to `end` (excluded) are
+        replaced by `lines`. Only the new lines are parsed."""
+        replacement = ParsedBuffer(lines, self.todoist)
+        to_return = ParsedBuffer([], self.todoist)
+        to_return._raw_lines = [
+            *self._raw_lines[:start],
+            *replacement._raw_lines,
+            *self._raw_lines[end:],
+        ]
+        to_return.items = [*self.items[:start], *replacement.items, *self.items[end:]]
+        return to_return
+
+    def get_item_for_update(self, i: int):
+        """Return the item of line `i`, to be modified in place. Items shared with
+        other snapshots (see `_parse_line`) are copied first."""
+        item = self.items[i]
+        if self._items_by_line.get(self._raw_lines[i]) is item:
+            item = self.items[i] = deepcopy(item)
+        return item
+
+    def get_project_separator_index(self, project: Project) -> Optional[int]:
+        """Return the index of the line closing the task list of `project`."""
+        if self._project_separator_indices is None:
+            self._project_separator_indices = dict()
+            current_project = None
+            for i, item in enumerate(self.items):
+                if isinstance(item, (Project, CustomSection)):
+                    current_project = item
+                elif isinstance(item, ProjectSeparator) and isinstance(
+                    current_project, Project
+                ):
+                    self._project_separator_indices.setdefault(current_project.id, i)
+                    current_project = None
+        return self._project_separator_indices.get(project.id)
+
+    def get_project_above(self, i: int) -> Optional[Project]:
+        """Return the last project whose name is displayed strictly above line `i`."""
+        index = self.get_project_line_index_above(i)
+        return self.items[index] if index is not None else None
+
+    def get_project_line_index_above(self, i: int) -> Optional[int]:
+        k = bisect.bisect_left(self.get_project_line_indices(), i)
+        if k == 0:
+            return None
+        return self._project_line_indices[k - 1]
+
+    def get_project_line_indices(self) -> List[int]:
+        if self._project_line_indices is None:
+            self._project_line_indices = [
+                k for k, item in enumerate(self.items) if isinstance(item, Project)
+            ]
+        return self._project_line_indices
+
+    def get_lines(self) -> List[str]:
+        """The lines rendered from the items, as compared by `Diff`."""
+        if self._lines is None:
+            self._lines = [str(item) for item in self.items]
+        return self._lines
+
+    def get_line_hashes(self) -> List[int]:
+        """Hashes of `get_lines()`: lines are compared by hash first, and by content
+        only when the hashes are equal."""
+        if self._line_hashes is None:
+            self._line_hashes = [hash(line) for line in self.get_lines()]
+        return self._line_hashes
+
+    def get_task_line_index(self, task: Task) -> Optional[int]:
+        """Return the (0-based) index of the first line displaying `task`."""
+        if self._task_line_indices is None:
+            self._task_line_indices = dict()
+            for i, item in enumerate(self.items):
+                if isinstance(item, Task) and item.id != "[Not synced]":
+                    self._task_line_indices.setdefault(item.id, i)
+        return self._task_line_indices.get(task.id)
+
     def _get_project_or_section_at_line(self, i: int) -> Union[Project, CustomSection]:
         # We take the first project that we encounter by "moving up" in the document.
         for item in self[:i][::-1]:
@@ -864,8 +2841,13 @@ class ParsedBuffer:
     # are available) whereas `other` might not be.
     def compare_with(self, other):
         diff = Diff(self, other)
+        segments = list(diff)
+        line_indices = diff.align(segments)
+        queue_start = len(self.todoist.api.queue)
+        # The tasks added, by line of `other`.
+        added_tasks = dict()
 
-        for diff_segment in diff:
+        for diff_segment in segments:
             # We apply `-1` because the indices returned by the Diff engine are relative
             # to a text buffer which starts indexing at 1.
             # The ParsedBuffer, however, starts indexing at 0.
@@ -887,11 +2869,24 @@ class ParsedBuffer:
             afters = diff_segment.modified_lines
             afters.extend([None for _ in range(len(afters), modification_span)])
 
+            line_hashes = self.get_line_hashes()
+            lines = self.get_lines()
             for i, (item_before, item_after) in enumerate(zip(befores, afters)):
+                if (
+                    item_before is not None
+                    and item_after is not None
+                    and diff_segment.action_type == "c"
+                    and line_hashes[from_index + i] == hash(item_after)
+                    and lines[from_index + i] == item_after
+                ):
+                    # The line is part of a change, but is itself unchanged.
+                    continue
                 if item_before is None or diff_segment.action_type == "a":
                     if str(item_after).strip() == "":
                         # We prevent from adding an empty task
                         continue
+                    if CollapsedTasks.parse(item_after) is not None:
+                        continue
                     new_task = Task.parse(item_after)
                     if not new_task.is_complete:
                         # We wan to create a task. There are two cases:
@@ -906,7 +2901,7 @@ class ParsedBuffer:
                             project_id = parent.id
                         elif isinstance(parent, CustomSection):
                             project_id = self._get_inbox_project().id
-                        self.todoist.add_task(
+                        added_tasks[diff_segment.rhs_index + i] = self.todoist.add_task(
                             content=new_task.content, project_id=project_id
                         )
                 elif item_after is None or diff_segment.action_type == "d":
@@ -916,15 +2911,109 @@ class ParsedBuffer:
                         else:
                             item_before.delete(impact_remote=True)
                 else:
-                    if isinstance(item_before, Task):
+                    # Tasks that aren't synced are shared with the other snapshots
+                    # (see `_parse_line`), and have nothing to update remotely.
+                    if (
+                        isinstance(item_before, Task)
+                        and item_before.id != "[Not synced]"
+                    ):
+                        if CollapsedTasks.parse(item_after) is not None:
+                            continue
                         new_task = Task.parse(item_after)
-                        if not new_task.is_complete:
-                            item_before.update(content=new_task.content)
-                        else:
+                        if new_task.is_complete:
                             item_before.complete(impact_remote=True)
+                        elif new_task.content != item_before.content:
+                            # Otherwise only the indentation changed. This is
+                            # handled by `_reconcile_hierarchy`.
+                            item_before.update(content=new_task.content)
                     elif isinstance(item_before, Project):
                         item_before.update(name=item_after)
 
+        self._reconcile_hierarchy(other, line_indices, added_tasks, queue_start)
+
+    def _reconcile_hierarchy(
+        self,
+        other,
+        line_indices: List[Optional[int]],
+        added_tasks: dict,
+        queue_start: int,
+    ):
+        """Turn the indentation of `other` into parent relationships.
+
+        The tasks of `other` are matched with the ones of `self` through the lines
+        aligned by the diff (see `Diff.align`), so that tasks sharing a content
+        aren't mixed up. New tasks get their parent in their `item_add` command, the
+        others are moved with `item_move`. The commands are then ordered so that
+        parents are created before their children, and children are moved before
+        their former parent is deleted or completed."""
+        added_parents = dict()
+        moves_start = len(self.todoist.api.queue)
+        stack = []
+        project = None
+        for j, item in enumerate(other):
+            if isinstance(item, CustomSection):
+                # Tasks aren't nested in custom sections.
+                break
+            if isinstance(item, Project):
+                project = self.todoist.get_project_by_name(item.name)
+                stack = []
+                continue
+            if not isinstance(item, Task) or item.is_complete:
+                continue
+            if j in added_tasks:
+                task = Task(data=added_tasks[j])
+            else:
+                i = line_indices[j]
+                item_before = None if i is None else self[i]
+                if not isinstance(item_before, Task):
+                    continue
+                task = self.todoist.tasks_by_id.get(item_before.id)
+                if task is None:
+                    continue
+            # The parent is the closest task above, with a smaller indentation.
+            while stack and stack[-1][0] >= item.depth:
+                stack.pop()
+            parent_id = stack[-1][1].id if stack else None
+            stack.append((item.depth, task))
+
+            if j in added_tasks:
+                added_parents[task.id] = parent_id
+                continue
+            if parent_id == (task.parent.id if task.parent is not None else None):
+                continue
+            if parent_id is not None:
+                task.move(parent_id=parent_id)
+            elif project is not None:
+                task.move(project_id=project.id)
+                task.data["parent_id"] = None
+
+        moves = self.todoist.api.queue[moves_start:]
+        if not moves and not any(added_parents.values()):
+            return
+
+        # Re-ordering the commands of this comparison: additions (from top to
+        # bottom), then moves, then everything else.
+        commands = self.todoist.api.queue[queue_start:moves_start]
+        additions = {
+            command["temp_id"]: command
+            for command in commands
+            if command["type"] == "item_add"
+        }
+        for temp_id, parent_id in added_parents.items():
+            if parent_id is not None:
+                additions[temp_id]["args"]["parent_id"] = parent_id
+        others = [command for command in commands if command["type"] != "item_add"]
+        self.todoist.api.queue[queue_start:] = [
+            *[additions[temp_id] for temp_id in added_parents],
+            *[
+                command
+                for temp_id, command in additions.items()
+                if temp_id not in added_parents
+            ],
+            *moves,
+            *others,
+        ]
+
 
 BG_COLORS_ID_TO_HEX = {
     30: "#b8256f",
@@ -949,13 +3038,18 @@ BG_COLORS_ID_TO_HEX = {
     49: "#ccac93",
 }
 
-TodoistObjects = Union[Task, Project, ProjectUnderline, ProjectSeparator]
+TodoistObjects = Union[
+    Task, Project, ProjectUnderline, CollapsedTasks, ProjectSeparator
+]
 
 
 class Diff:
     def __init__(self, lhs: ParsedBuffer, rhs: ParsedBuffer):
         self.lhs = lhs
         self.rhs = rhs
+        # Number of identical lines at the top of both buffers, left out of the raw
+        # diff. See `get_raw_diff`.
+        self.offset = 0
 
         self.raw_diff = self.get_raw_diff(self.lhs, self.rhs)
 
@@ -991,37 +3085,92 @@ class Diff:
                 modified_items = modified_items[:-1]  # Deleting the last "."
                 yield DiffSegment(
                     matches.group("action_type"),
-                    matches.group("from_index"),
-                    matches.group("to_index"),
+                    from_index + self.offset,
+                    self._shift(matches.group("to_index")),
                     modified_items,
                 )
 
             elif matches.group("action_type") == "d":
                 yield DiffSegment(
                     matches.group("action_type"),
-                    matches.group("from_index"),
-                    matches.group("to_index"),
+                    self._shift(matches.group("from_index")),
+                    self._shift(matches.group("to_index")),
                     [],
                 )
 
             i_lines += 1
 
+    def align(self, segments: List[DiffSegment]) -> List[Optional[int]]:
+        """Return, for every line of `rhs`, the index of the line of `lhs` that it
+        keeps or replaces, or None if it was added. The changed lines are paired in
+        order, like `ParsedBuffer.compare_with` does.
+
+        This also sets the `rhs_index` of the segments."""
+        line_indices = []
+        lhs_index = 0
+        for segment in sorted(segments, key=lambda segment: segment.from_index):
+            # Lines are indexed from 1, and new lines come after `from_index`.
+            start = segment.from_index - (segment.action_type != "a")
+            line_indices.extend(range(lhs_index, start))
+            lhs_index = start
+            segment.rhs_index = len(line_indices)
+            if segment.action_type == "a":
+                line_indices.extend([None] * len(segment))
+                continue
+            end = segment.to_index - 1
+            if segment.action_type == "c":
+                line_indices.extend(
+                    lhs_index + k if lhs_index + k < end else None
+                    for k in range(len(segment))
+                )
+            lhs_index = end
+        line_indices.extend(range(lhs_index, len(self.lhs.get_lines())))
+        return line_indices
+
+    def _shift(self, index: Optional[str]) -> Optional[int]:
+        return None if index is None else int(index) + self.offset
+
     @abstractmethod
     def get_raw_diff(self, lhs: ParsedBuffer, rhs: ParsedBuffer):
+        lhs_lines, lhs_hashes = lhs.get_lines(), lhs.get_line_hashes()
+        rhs_lines, rhs_hashes = rhs.get_lines(), rhs.get_line_hashes()
+
+        # Most saves only change a few lines: the identical lines at the top and at
+        # the bottom of the buffers are left out of the diff, like `diff` does.
+        # Lines are compared by hash, and by content only when the hashes are equal.
+        length = min(len(lhs_lines), len(rhs_lines))
+        start = 0
+        while (
+            start < length
+            and lhs_hashes[start] == rhs_hashes[start]
+            and lhs_lines[start] == rhs_lines[start]
+        ):
+            start += 1
+        end = 0
+        while (
+            end < length - start
+            and lhs_hashes[-end - 1] == rhs_hashes[-end - 1]
+            and lhs_lines[-end - 1] == rhs_lines[-end - 1]
+        ):
+            end += 1
+        if start == len(lhs_lines) == len(rhs_lines):
+            return [""]
+        self.offset = start
+        lhs_lines = lhs_lines[start : len(lhs_lines) - end]
+        rhs_lines = rhs_lines[start : len(rhs_lines) - end]
+
         # TODO: that's dirty. Ideally we should pipe directly to `diff`.
-        path_lhs = Path("/tmp/lhs")
-        if path_lhs.exists():
-            path_lhs.unlink()
-        path_lhs.write_text("\n".join([str(item) for item in lhs]))
-
-        path_rhs = Path("/tmp/rhs")
-        if path_rhs.exists():
-            path_rhs.unlink()
-        path_rhs.write_text("\n".join([str(item) for item in rhs]))
-
-        diff_output = subprocess.run(
-            ["diff", "-e", str(path_lhs), str(path_rhs)], capture_output=True
-        )
+        # The files live in a directory of their own, so that concurrent diffs
+        # (from this instance or another one) don't overwrite each other.
+        with tempfile.TemporaryDirectory(dir=scratch_directory()) as directory:
+            path_lhs = Path(directory) / "lhs"
+            path_lhs.write_text("".join(f"{line}\n" for line in lhs_lines))
+            path_rhs = Path(directory) / "rhs"
+            path_rhs.write_text("".join(f"{line}\n" for line in rhs_lines))
+
+            diff_output = subprocess.run(
+                ["diff", "-e", str(path_lhs), str(path_rhs)], capture_output=True
+            )
         # Trimming the last "\n"
         diff_output = diff_output.stdout.decode()[:-1]
 
@@ -1034,6 +3183,8 @@ class DiffSegment:
     from_index: Union[str, int]
     to_index: Optional[Union[str, int]]
     modified_lines: List[Union[str, Task]]
+    # The index of the first modified line in the new buffer. See `Diff.align`.
+    rhs_index: Optional[int] = None
 
     def __post_init__(self):
         self.from_index: int = int(self.from_index)
@@ -1052,6 +3203,17 @@ class DiffSegment:
         yield from self.modified_lines
 
 
+def line_edits(old: List[str], new: List[str]) -> List[Tuple[int, int, List[str]]]:
+    """The `(start, end, replacement)` edits turning `old` into `new`, from the
+    bottom of the buffer to the top so that they can be applied in order."""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [
+        (i1, i2, new[j1:j2])
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes())
+        if tag != "equal"
+    ]
+
+
 def sanitize_str(s):
     # fmt: off
     special_chars = [
@@ -1062,3 +3224,33 @@ def sanitize_str(s):
     for char in special_chars:
         s = s.replace(char, "")
     return s
+
+
+def _isodate(date) -> Optional[str]:
+    if date is None or isinstance(date, str):
+        return date
+    return date.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyTodoist.nvim companion tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    daemon_parser = subparsers.add_parser(
+        "daemon", help="Share a synced workspace between Neovim instances."
+    )
+    daemon_parser.add_argument("--socket", default=DAEMON_SOCKET_PATH)
+    daemon_parser.add_argument("--idle-timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    if not os.environ.get("TODOIST_API_KEY"):
+        raise ValueError("Can't find the TODOIST_API_KEY env var.")
+    interface = TodoistInterface.from_token(
+        os.environ.get("TODOIST_API_KEY"),
+        api_endpoint=os.environ.get("TODOIST_API_ENDPOINT", API_ENDPOINT),
+        journal=CommandJournal(JOURNAL_PATH),
+    )
+    SyncDaemon(args.socket, interface, idle_timeout=args.idle_timeout).serve()
+
+
+if __name__ == "__main__":
+    main()
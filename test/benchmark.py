@@ -0,0 +1,165 @@
+"""Scaling benchmarks on synthetic workspaces.
+
+Usage:
+    python test/benchmark.py --output results.json
+    python test/benchmark.py --sizes 100 1000 --compare results.json
+
+Every step is timed on workspaces of increasing size. The highlight refresh is only
+benchmarked when a `nvim` executable is available.
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "test"))
+
+import pynvim
+
+from fakes import GeneratedFakeApi
+from rplugin.python3.pytodoist import Diff, ParsedBuffer, Plugin, TodoistInterface
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+
+def make_interface(n_tasks: int, args) -> TodoistInterface:
+    api = GeneratedFakeApi(
+        n_projects=max(1, n_tasks // args.tasks_per_project),
+        n_tasks=n_tasks,
+        depth=args.depth,
+        label_density=args.label_density,
+    )
+    return TodoistInterface(api)
+
+
+def edit_lines(lines):
+    # Editing 1% of the task lines.
+    edited = list(lines)
+    for i in range(0, len(edited), 100):
+        if edited[i].startswith("[ ] "):
+            edited[i] = f"{edited[i]} (edited)"
+    return edited
+
+
+def timeit(fn, setup=None, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(state)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def attach_nvim():
+    if shutil.which("nvim") is None:
+        return None
+    return pynvim.attach("child", argv=["nvim", "-u", "NONE", "--embed", "--headless"])
+
+
+def benchmark_size(n_tasks: int, args, nvim=None) -> dict:
+    interface = make_interface(n_tasks, args)
+    results = dict()
+
+    results["sync"] = timeit(lambda _: interface.sync(), repeat=args.repeat)
+    results["render"] = timeit(
+        lambda _: [str(item) for item in interface], repeat=args.repeat
+    )
+    lines = [str(item) for item in interface]
+    edited = edit_lines(lines)
+
+    results["parse"] = timeit(
+        lambda _: ParsedBuffer(lines, interface), repeat=args.repeat
+    )
+    lhs, rhs = ParsedBuffer(lines, interface), ParsedBuffer(edited)
+    results["diff"] = timeit(lambda _: list(Diff(lhs, rhs)), repeat=args.repeat)
+
+    def setup_compare():
+        interface.api.queue = []
+        return ParsedBuffer(lines, interface), ParsedBuffer(edited)
+
+    results["compare_with"] = timeit(
+        lambda buffers: buffers[0].compare_with(buffers[1]),
+        setup=setup_compare,
+        repeat=args.repeat,
+    )
+
+    if nvim is not None:
+        plugin = Plugin(nvim)
+        plugin.todoist = interface
+        nvim.current.buffer[:] = lines
+        plugin.parsed_buffer = ParsedBuffer(lines, interface)
+        results["highlights"] = timeit(
+            lambda _: plugin._refresh_highlights(), repeat=args.repeat
+        )
+
+    return results
+
+
+def git_revision():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, cwd=ROOT
+        )
+        return output.stdout.decode().strip()
+    except OSError:
+        return None
+
+
+def compare(results: dict, previous: dict):
+    print(f"\nComparison with {previous['revision']} (ratio new / old):")
+    for size, steps in results["sizes"].items():
+        previous_steps = previous["sizes"].get(size)
+        if previous_steps is None:
+            continue
+        for step, duration in steps.items():
+            if previous_steps.get(step):
+                ratio = duration / previous_steps[step]
+                print(f"  {size:>7} {step:<14} {ratio:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--tasks-per-project", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--label-density", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    args = parser.parse_args()
+
+    nvim = attach_nvim()
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "parameters": {
+            "tasks_per_project": args.tasks_per_project,
+            "depth": args.depth,
+            "label_density": args.label_density,
+        },
+        "sizes": dict(),
+    }
+    for n_tasks in args.sizes:
+        steps = benchmark_size(n_tasks, args, nvim)
+        results["sizes"][str(n_tasks)] = steps
+        for step, duration in steps.items():
+            print(f"{n_tasks:>7} {step:<14} {duration * 1000:10.2f} ms")
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare is not None:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare the HTTP layer of the default Todoist client and of `HttpSession`, against
+the stand-in server.
+
+Usage:
+    python test/benchmark_http.py --cycles 20 --stall 5
+
+Every cycle edits a task, commits it and syncs, like a save of the `.todoist`
+buffer does. Both clients reuse their connections and ask for compressed
+responses: they are expected to perform the same. What `HttpSession` adds is a
+default timeout, checked against a server that stalls for `--stall` seconds.
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "test"))
+
+import requests
+import todoist
+
+from fake_server import FakeTodoistServer, FakeTodoistState
+from rplugin.python3.pytodoist import TodoistInterface
+
+
+def make_interface(name: str, url: str, timeout) -> TodoistInterface:
+    if name == "default":
+        return TodoistInterface(
+            todoist.TodoistAPI("benchmark", api_endpoint=url, cache=None)
+        )
+    return TodoistInterface.from_token(
+        "benchmark", api_endpoint=url, timeout=timeout, cache=None
+    )
+
+
+def run_cycles(interface: TodoistInterface, server: FakeTodoistServer, cycles: int):
+    connection_count, bytes_sent = server.connection_count, server.bytes_sent
+    start = time.perf_counter()
+    interface.sync()
+    for i in range(cycles):
+        interface.tasks_by_id["1"].update(content=f"Task 1 (edit {i})")
+        interface.commit()
+        interface.sync()
+    return {
+        "duration": time.perf_counter() - start,
+        "connections": server.connection_count - connection_count,
+        "bytes": server.bytes_sent - bytes_sent,
+    }
+
+
+def time_stalled_sync(interface: TodoistInterface) -> str:
+    start = time.perf_counter()
+    try:
+        interface.sync()
+        outcome = "synced"
+    except requests.Timeout:
+        outcome = "timed out"
+    return f"{outcome} after {time.perf_counter() - start:.1f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--connection-latency", type=float, default=0.05)
+    parser.add_argument("--stall", type=float, default=5.0)
+    parser.add_argument("--read-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+    timeout = (5.0, args.read_timeout)
+
+    for name in ["default", "HttpSession"]:
+        server = FakeTodoistServer(
+            state=FakeTodoistState.generate(args.projects, args.tasks),
+            latency=args.latency,
+            connection_latency=args.connection_latency,
+        ).start()
+        interface = make_interface(name, server.url, timeout)
+        result = run_cycles(interface, server, args.cycles)
+        server.latency = args.stall
+        stalled = time_stalled_sync(interface)
+        server.stop()
+        print(
+            f"{name:<12} {result['duration'] * 1000:10.1f} ms "
+            f"{result['connections']:>5} connections "
+            f"{result['bytes'] / 1024:10.1f} KiB received, "
+            f"stalled server: {stalled}"
+        )
+
+
+if __name__ == "__main__":
+    main()
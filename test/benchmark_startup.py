@@ -0,0 +1,78 @@
+"""Measure what loading the plugin adds to the startup of the Neovim plugin host.
+
+Usage:
+    python test/benchmark_startup.py --repeat 20
+
+Every measure runs in a fresh interpreter, which has already imported `pynvim` like
+the plugin host. Importing the module, creating the `Plugin` and finding its
+handlers should cost close to nothing: the Todoist client and the heavy dependencies
+are only loaded when a `.todoist` buffer is opened.
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["requests", "todoist", "urllib3", "argparse", "difflib"]
+
+MEASURE = """
+import sys
+import json
+import time
+import types
+import inspect
+
+import pynvim
+
+start = time.perf_counter()
+import rplugin.python3.pytodoist as pytodoist
+imported = time.perf_counter()
+plugin = pytodoist.Plugin(types.SimpleNamespace(request=None))
+created = time.perf_counter()
+# Like the plugin host, looking for the handlers.
+inspect.getmembers(plugin, lambda member: hasattr(member, "_nvim_rpc_method_name"))
+discovered = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "init": created - imported,
+    "discovery": discovered - created,
+    "modules": [name for name in sys.argv[1:] if name in sys.modules],
+}))
+"""
+
+
+def measure() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE, *HEAVY_MODULES],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+    )
+    return json.loads(output.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    # The first run also writes the bytecode cache.
+    measure()
+    results = [measure() for _ in range(args.repeat)]
+
+    for step in ["import", "init", "discovery"]:
+        durations = sorted(result[step] for result in results)
+        print(
+            f"{step:<10} min {durations[0] * 1000:8.2f} ms "
+            f"median {durations[len(durations) // 2] * 1000:8.2f} ms"
+        )
+    modules = results[-1]["modules"]
+    print(f"Heavy modules loaded at startup: {', '.join(modules) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
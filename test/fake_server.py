@@ -0,0 +1,336 @@
+"""A local stand-in for the Todoist sync API.
+
+It implements the subset of the sync endpoint used by the plugin: incremental reads
+with sync tokens, and the item/project/label commands with temporary ids. Latency,
+error rate and rate limiting can be configured to run load and soak tests.
+
+Usage:
+    python test/fake_server.py --port 8080 --tasks 10000 --latency 0.05
+
+Then point the plugin at it with `TODOIST_API_ENDPOINT=http://127.0.0.1:8080`.
+"""
+
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from collections import deque
+from typing import Iterable
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import GeneratedFakeApi
+
+RESOURCE_TYPES = ["items", "projects", "labels"]
+
+
+class FakeTodoistState:
+    """The server side workspace, with a log of the changes for incremental syncs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = {resource_type: dict() for resource_type in RESOURCE_TYPES}
+        # Sequence number of the last change of every object.
+        self.changes = {resource_type: dict() for resource_type in RESOURCE_TYPES}
+        self.sequence = 0
+        self.applied_commands = dict()
+        self._next_id = 1
+
+    @classmethod
+    def generate(cls, n_projects: int, n_tasks: int, **kwargs):
+        api = GeneratedFakeApi(n_projects=n_projects, n_tasks=n_tasks, **kwargs)
+        state = cls()
+        for resource_type in RESOURCE_TYPES:
+            for obj in api.state[resource_type]:
+                state.put(resource_type, dict(obj.data))
+        state._next_id = max(int(item["id"]) for item in api.state["items"]) + 1
+        return state
+
+    def new_id(self) -> str:
+        # Real ids are large integers, but the plugin treats them as opaque.
+        new_id = str(self._next_id)
+        self._next_id += 1
+        return new_id
+
+    def put(self, resource_type: str, obj: dict):
+        self.sequence += 1
+        self.objects[resource_type][obj["id"]] = obj
+        self.changes[resource_type][obj["id"]] = self.sequence
+
+    def read(self, sync_token: str) -> dict:
+        full_sync = sync_token == "*"
+        since = 0 if full_sync else int(sync_token)
+        response = {"sync_token": str(self.sequence), "full_sync": full_sync}
+        for resource_type in RESOURCE_TYPES:
+            response[resource_type] = [
+                self.objects[resource_type][obj_id]
+                for obj_id, sequence in self.changes[resource_type].items()
+                if sequence > since
+            ]
+        return response
+
+    def completed(self, limit: int = 30, offset: int = 0) -> dict:
+        with self.lock:
+            items = [
+                item
+                for item in self.objects["items"].values()
+                if item.get("date_completed") is not None and not item["is_deleted"]
+            ]
+        # Most recently completed first, like Todoist.
+        items.sort(key=lambda item: (item["date_completed"], int(item["id"])))
+        items.reverse()
+        return {
+            "items": [
+                {
+                    "id": item["id"],
+                    "task_id": item["id"],
+                    "content": item["content"],
+                    "project_id": item["project_id"],
+                    "completed_date": item["date_completed"],
+                }
+                for item in items[offset : offset + min(limit, 200)]
+            ],
+            "projects": dict(),
+        }
+
+    def apply(self, command: dict, temp_id_mapping: dict) -> str:
+        if command["uuid"] in self.applied_commands:
+            # Commands are idempotent: replaying one doesn't apply it twice.
+            return self.applied_commands[command["uuid"]]
+
+        args = dict(command["args"])
+        for key in ["id", "project_id", "parent_id"]:
+            if args.get(key) in temp_id_mapping:
+                args[key] = temp_id_mapping[args[key]]
+
+        resource_type, action = command["type"].split("_", 1)
+        resource_type = f"{resource_type}s"
+        if action == "add":
+            obj = {"id": self.new_id(), "is_deleted": 0, **args}
+            if resource_type == "items":
+                obj.setdefault("labels", [])
+                obj.setdefault("parent_id", None)
+                obj.setdefault("child_order", 1)
+                obj.setdefault("in_history", 0)
+                obj.setdefault("date_completed", None)
+            temp_id_mapping[command["temp_id"]] = obj["id"]
+            self.put(resource_type, obj)
+            status = "ok"
+        elif args["id"] not in self.objects.get(resource_type, {}):
+            status = {"error_code": 22, "error": "Item not found"}
+        else:
+            obj = dict(self.objects[resource_type][args.pop("id")])
+            if action in ["update", "move"]:
+                obj.update(args)
+                if action == "move" and "parent_id" not in args:
+                    # Moving an item to a project makes it a root item.
+                    obj["parent_id"] = None
+            elif action == "delete":
+                obj["is_deleted"] = 1
+            elif action in ["close", "complete"]:
+                obj["in_history"] = 1
+                obj["date_completed"] = time.strftime("%Y-%m-%dT%H:%M:%SZ")
+            self.put(resource_type, obj)
+            status = "ok"
+
+        self.applied_commands[command["uuid"]] = status
+        return status
+
+    def sync(self, sync_token: str, commands: list) -> dict:
+        with self.lock:
+            temp_id_mapping = dict()
+            sync_status = {
+                command["uuid"]: self.apply(command, temp_id_mapping)
+                for command in commands
+            }
+            response = self.read(sync_token)
+            if commands:
+                response["sync_status"] = sync_status
+                response["temp_id_mapping"] = temp_id_mapping
+            return response
+
+    def complete(self, task_ids: Iterable):
+        """Complete tasks, as another client would."""
+        self.sync(
+            "*",
+            [
+                {
+                    "type": "item_complete",
+                    "uuid": f"complete-{i}",
+                    "args": {"id": str(i)},
+                }
+                for i in task_ids
+            ],
+        )
+
+
+class FakeTodoistServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        state: FakeTodoistState = None,
+        latency: float = 0.0,
+        connection_latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: int = None,
+        rate_limit_period: float = 60.0,
+        seed: int = 0,
+    ):
+        super().__init__(address, FakeTodoistRequestHandler)
+        self.state = state if state is not None else FakeTodoistState()
+        self.latency = latency
+        # Simulates the cost of establishing a connection (TCP and TLS handshakes).
+        self.connection_latency = connection_latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        # Simulates a proxy in front of Todoist, answering with an HTML error page.
+        self.bad_gateway = False
+        self.request_count = 0
+        self.connection_count = 0
+        self.bytes_sent = 0
+        self._recent_requests = deque()
+        self._random = random.Random(seed)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def is_rate_limited(self) -> bool:
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        while (
+            self._recent_requests
+            and now - self._recent_requests[0] > self.rate_limit_period
+        ):
+            self._recent_requests.popleft()
+        if len(self._recent_requests) >= self.rate_limit:
+            return True
+        self._recent_requests.append(now)
+        return False
+
+    def should_fail(self) -> bool:
+        return self._random.random() < self.error_rate
+
+
+class FakeTodoistRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately: with Nagle's algorithm, every response
+    # on a kept-alive connection would wait for a delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connection_count += 1
+        time.sleep(self.server.connection_latency)
+
+    def do_GET(self):
+        server = self.server
+        server.request_count += 1
+        time.sleep(server.latency)
+
+        url = urlsplit(self.path)
+        if not url.path.endswith("/completed/get_all"):
+            return self.send_json(404, {"error": "Not found", "http_code": 404})
+        query = parse_qs(url.query)
+        limit = int(query.get("limit", [30])[0])
+        offset = int(query.get("offset", [0])[0])
+        self.send_json(200, server.state.completed(limit=limit, offset=offset))
+
+    def do_POST(self):
+        server = self.server
+        server.request_count += 1
+        time.sleep(server.latency)
+
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if not self.path.endswith("/sync"):
+            return self.send_json(404, {"error": "Not found", "http_code": 404})
+        if server.is_rate_limited():
+            return self.send_json(
+                429, {"error": "Too many requests", "error_code": 35, "http_code": 429}
+            )
+        if server.bad_gateway:
+            return self.send_body(
+                502, b"<html><body>502 Bad Gateway</body></html>", "text/html"
+            )
+        if server.should_fail():
+            return self.send_json(
+                503, {"error": "Service unavailable", "http_code": 503}
+            )
+
+        sync_token = form.get("sync_token", ["*"])[0]
+        commands = json.loads(form.get("commands", ["[]"])[0])
+        self.send_json(200, server.state.sync(sync_token, commands))
+
+    def send_json(self, code: int, payload: dict):
+        self.send_body(code, json.dumps(payload).encode(), "application/json")
+
+    def send_body(self, code: int, body: bytes, content_type: str):
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        if self.headers.get("Connection", "").lower() == "close":
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--connection-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None)
+    parser.add_argument("--rate-limit-period", type=float, default=60.0)
+    args = parser.parse_args()
+
+    server = FakeTodoistServer(
+        (args.host, args.port),
+        state=FakeTodoistState.generate(args.projects, args.tasks),
+        latency=args.latency,
+        connection_latency=args.connection_latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        rate_limit_period=args.rate_limit_period,
+    )
+    print(f"Serving a fake Todoist sync API on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import random
+
+import todoist
+
+
+class FakeItemsManager(todoist.managers.items.ItemsManager):
+    pass
+
+
+class FakeApi(todoist.api.TodoistAPI):
+    def __init__(self):
+        self.queue = []
+
+        self.state = dict()
+        self.state["projects"] = [self._project_factory(i) for i in range(1, 4)]
+        self.state["items"] = [
+            *[self._task_factory(i, project_id=1) for i in range(1, 4)],
+            *[self._task_factory(i, project_id=2) for i in range(4, 7)],
+            *[self._task_factory(i, project_id=3) for i in range(7, 10)],
+        ]
+        self.state["labels"] = [self._label_factory(i) for i in range(1, 4)]
+
+        # Assigning Tasks 1 and 7 with label `1`.
+        self.state["items"][0]["labels"] = ["1"]
+        self.state["items"][6]["labels"] = ["1"]
+
+        # We make Project 1 the inbox project.
+        self.state["projects"][0].data["inbox_project"] = True
+
+        # In order to test that the projects get displayed in the correct order, we
+        # alter the natural ordering.
+        self.state["projects"] = self.state["projects"][::-1]
+        # Setting `Project 2` as a child of `Project 1`.
+        self.state["projects"][1]["parent_id"] = "1"
+        self.state["projects"][1]["child_order"] = 1
+
+        # We do the same for the tasks.
+        self.state["items"] = self.state["items"][::-1]
+        # Setting `Task 8` as a child of `Task 7`.
+        self.state["items"][7]["parent_id"] = "6"
+        self.state["items"][7]["child_order"] = 1
+
+    def sync(self, commands=None):
+        return commands
+
+    def commit(self, raise_on_error=True):
+        # Similar to the original implementation of `commit`, except that we take
+        # care not to delete the queue.
+        if len(self.queue) == 0:
+            return
+        ret = self.sync(commands=self.queue)
+        return ret
+
+    @property
+    def items(self):
+        return FakeItemsManager(api=self)
+
+    def _task_factory(self, task_id: int, project_id: int):
+        return todoist.models.Item(
+            api=self,
+            data={
+                "content": f"Task {task_id}",
+                "project_id": str(project_id),
+                "id": str(task_id),
+                "is_deleted": 0,
+                "in_history": 0,
+                "date_completed": None,
+                "child_order": (task_id - 1) % 3,
+                "parent_id": None,
+                "labels": [],
+                "priority": 1,
+                "due": None,
+            },
+        )
+
+    def _project_factory(self, project_id: int):
+        return todoist.models.Project(
+            api=self,
+            data={
+                "name": f"Project {project_id}",
+                "id": str(project_id),
+                "is_archived": 0,
+                "is_deleted": 0,
+                "color": project_id + 30,
+                "parent_id": None,
+                "child_order": project_id,
+                "inbox_project": False,
+            },
+        )
+
+    def _label_factory(self, label_id: int):
+        return todoist.models.Label(
+            api=self,
+            data={
+                "name": f"Label {label_id}",
+                "id": str(label_id),
+                "item_order": label_id,
+                "is_deleted": 0,
+                "is_favorite": 0,
+            },
+        )
+
+
+class GeneratedFakeApi(FakeApi):
+    """A `FakeApi` holding a synthetic workspace of arbitrary size.
+
+    Tasks are spread evenly across projects. Within a project, tasks are nested
+    in chains of `depth` levels, and each task carries a random label with
+    probability `label_density`."""
+
+    def __init__(
+        self,
+        n_projects: int,
+        n_tasks: int,
+        depth: int = 1,
+        label_density: float = 0.1,
+        n_labels: int = 20,
+        seed: int = 0,
+    ):
+        self.queue = []
+        rng = random.Random(seed)
+
+        self.state = dict()
+        self.state["projects"] = [
+            self._project_factory(i) for i in range(1, n_projects + 1)
+        ]
+        for project in self.state["projects"]:
+            # There are only 20 colors available.
+            project["color"] = 30 + (int(project["id"]) - 1) % 20
+        self.state["projects"][0].data["inbox_project"] = True
+        self.state["labels"] = [self._label_factory(i) for i in range(1, n_labels + 1)]
+
+        self.state["items"] = []
+        for i in range(1, n_tasks + 1):
+            project_index = (i - 1) % n_projects
+            rank = (i - 1) // n_projects
+            task = self._task_factory(i, project_id=project_index + 1)
+            task["child_order"] = rank
+            if rank % depth != 0:
+                # The previous task of the same project is the parent.
+                task["parent_id"] = str(i - n_projects)
+            if rng.random() < label_density:
+                task["labels"] = [str(rng.randint(1, n_labels))]
+            self.state["items"].append(task)
@@ -0,0 +1,50 @@
+import rplugin.python3.pytodoist as pytodoist
+from rplugin.python3.pytodoist import CompletedArchive
+
+
+def test_completed_archive_pages_are_cached(fake_server, remote_interface):
+    fake_server.state.complete(range(1, 10))
+    archive = CompletedArchive(
+        remote_interface.api.completed.get_all, page_size=4, max_pages=2
+    )
+
+    assert len(archive.get_page(0)) == 4
+    assert len(archive.get_page(1)) == 4
+    assert archive.has_page(2)
+    assert len(archive.get_page(2)) == 1
+    assert not archive.has_page(3)
+
+    request_count = fake_server.request_count
+    archive.get_page(2)
+    assert fake_server.request_count == request_count
+    # The first page was evicted from the cache.
+    archive.get_page(0)
+    assert fake_server.request_count == request_count + 1
+    assert archive.render(archive.get_page(0)[0]).startswith("[X] Task ")
+
+
+def test_archive_buffer_only_holds_the_pages_close_to_the_view(
+    plugin, vim, fake_server, remote_interface, monkeypatch
+):
+    monkeypatch.setattr(pytodoist, "VIEWPORT_MARGIN", 0)
+    fake_server.state.complete(range(1, 10))
+    plugin.todoist = remote_interface
+    plugin.archive = CompletedArchive(
+        remote_interface.api.completed.get_all, page_size=4, max_pages=2
+    )
+    plugin.todoist_archive([])
+    plugin.todoist_archive_scrolled([1, 9])
+    assert all(line.startswith("[X] Task ") for line in vim.current.buffer)
+    assert len(vim.current.buffer) == 9
+
+    # The lines far above the view are blanked, without moving the other ones.
+    plugin.todoist_archive_scrolled([9, 9])
+    assert list(vim.current.buffer)[:8] == [""] * 8
+    assert vim.current.buffer[8].startswith("[X] Task ")
+
+    # And filled again when scrolling back, from the cache or from the server.
+    plugin.todoist_archive_scrolled([1, 4])
+    assert list(vim.current.buffer)[4:] == [""] * 5
+    assert [line.startswith("[X] Task ") for line in vim.current.buffer[:4]] == [
+        True
+    ] * 4
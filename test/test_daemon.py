@@ -0,0 +1,139 @@
+import os
+import time
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+import rplugin.python3.pytodoist as pytodoist
+from rplugin.python3.pytodoist import (
+    CommandJournal,
+    DaemonApi,
+    DaemonConnection,
+    SyncDaemon,
+    TodoistInterface,
+)
+
+
+def start_daemon(fake_server, tmp_path) -> SyncDaemon:
+    upstream = TodoistInterface.from_token(
+        "test",
+        api_endpoint=fake_server.url,
+        cache=None,
+        journal=CommandJournal(tmp_path / "journal.jsonl"),
+    )
+    daemon = SyncDaemon(tmp_path / "daemon.sock", upstream, min_sync_interval=60)
+    threading.Thread(target=daemon.serve, daemon=True).start()
+    return daemon
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_daemon_shares_upstream_syncs_and_pushes_changes(fake_server, tmp_path):
+    daemon = start_daemon(fake_server, tmp_path)
+    first, second = [
+        TodoistInterface(DaemonApi(DaemonConnection(daemon.socket_path)))
+        for _ in range(2)
+    ]
+    first.sync()
+    second.sync()
+    assert len(second.tasks) == 9
+    assert daemon.upstream_sync_count == 1
+
+    new_task = first.add_task(content="Task 10", project_id="2")
+    first.tasks_by_id["1"].update(content="Task 1 (edited)")
+    first.commit()
+    assert new_task["id"] == "10"
+    assert fake_server.state.objects["items"]["1"]["content"] == "Task 1 (edited)"
+
+    wait_for(lambda: second.api.connection.pushes)
+    second.sync()
+    assert second.get_task_by_content("Task 1 (edited)") is not None
+    assert second.get_task_by_content("Task 10") is not None
+    daemon.shutdown()
+
+
+def test_daemon_journals_commands_when_offline(fake_server, tmp_path):
+    daemon = start_daemon(fake_server, tmp_path)
+    client = TodoistInterface(DaemonApi(DaemonConnection(daemon.socket_path)))
+    client.sync()
+    fake_server.error_rate = 1.0
+
+    client.tasks_by_id["1"].update(content="Task 1 (edited)")
+    client.commit()
+    assert len(daemon.interface.journal) == 1
+
+    fake_server.error_rate = 0.0
+    daemon.min_sync_interval = 0
+    client.sync()
+    assert len(daemon.interface.journal) == 0
+    assert fake_server.state.objects["items"]["1"]["content"] == "Task 1 (edited)"
+    daemon.shutdown()
+
+
+def kill_daemon(daemon: SyncDaemon):
+    daemon.shutdown()
+    for client in list(daemon.clients):
+        client.connection.shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: not daemon.socket_path.exists())
+
+
+def test_clients_reconnect_when_the_daemon_dies(fake_server, tmp_path, monkeypatch):
+    daemon = start_daemon(fake_server, tmp_path)
+    client = TodoistInterface(DaemonApi(DaemonConnection(daemon.socket_path)))
+    client.sync()
+    kill_daemon(daemon)
+
+    # No daemon can be spawned: the error is the one of an unreachable network.
+    def spawn(*args):
+        raise OSError("Can't spawn the daemon.")
+
+    monkeypatch.setattr(DaemonConnection, "_spawn", spawn)
+    with pytest.raises(requests.ConnectionError):
+        client.sync()
+
+    # Once a daemon is back, the client connects to it on its own.
+    daemon = start_daemon(fake_server, tmp_path)
+    client.tasks_by_id["1"].update(content="Task 1 (edited)")
+    client.commit()
+    client.sync()
+    assert fake_server.state.objects["items"]["1"]["content"] == "Task 1 (edited)"
+    assert client.get_task_by_content("Task 1 (edited)") is not None
+    assert len(client.tasks) == 9
+    daemon.shutdown()
+
+
+def test_daemon_socket_must_be_private(fake_server, tmp_path, monkeypatch):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    monkeypatch.setattr(DaemonConnection, "_spawn", pytest.fail)
+    with pytest.raises(PermissionError):
+        DaemonConnection.connect_or_spawn(shared / "daemon.sock")
+    with pytest.raises(PermissionError):
+        start_daemon(fake_server, shared)
+
+    # A daemon of another user is refused too.
+    daemon = start_daemon(fake_server, tmp_path)
+    monkeypatch.setattr(pytodoist, "private_directory", Path)
+    monkeypatch.setattr(pytodoist.os, "getuid", lambda: os.geteuid() + 1)
+    with pytest.raises(PermissionError):
+        DaemonConnection(daemon.socket_path)
+    daemon.shutdown()
+
+
+def test_daemon_forwards_completed_tasks(fake_server, tmp_path):
+    fake_server.state.complete([3])
+    daemon = start_daemon(fake_server, tmp_path)
+    api = DaemonApi(DaemonConnection(daemon.socket_path))
+
+    response = api.completed.get_all(limit=10, offset=0)
+    assert [item["content"] for item in response["items"]] == ["Task 3"]
+    daemon.shutdown()
@@ -0,0 +1,79 @@
+import todoist
+
+from rplugin.python3.pytodoist import TodoistInterface
+
+
+def test_full_sync(remote_interface):
+    assert len(remote_interface.projects) == 3
+    assert len(remote_interface.tasks) == 9
+    assert [str(item) for item in remote_interface][:5] == [
+        "Project 1",
+        "=========",
+        "[ ] Task 1",
+        "[ ] Task 4",
+        "[ ] Task 7",
+    ]
+
+
+def test_commands_with_temp_ids(remote_interface):
+    new_task = remote_interface.add_task(content="Task 10", project_id="2")
+    remote_interface.tasks_by_id["1"].update(content="Task 1 (edited)")
+    remote_interface.tasks_by_id["2"].delete()
+    remote_interface.commit()
+    remote_interface.sync()
+
+    assert new_task["id"] == "10"
+    contents = [task.content for task in remote_interface.tasks_by_project["2"]]
+    assert "Task 10" in contents
+    assert "Task 2" not in contents
+    assert remote_interface.get_task_by_content("Task 1 (edited)") is not None
+
+
+def test_incremental_sync(fake_server, remote_interface):
+    other_client = todoist.TodoistAPI("test", api_endpoint=fake_server.url, cache=None)
+    other_client.sync()
+    other_client.items.update("3", content="Edited elsewhere")
+    other_client.commit()
+
+    response = remote_interface.api.sync()
+    assert not response["full_sync"]
+    assert [item["content"] for item in response["items"]] == ["Edited elsewhere"]
+
+
+def test_rate_limit(fake_server):
+    fake_server.rate_limit = 1
+    api = todoist.TodoistAPI("test", api_endpoint=fake_server.url, cache=None)
+    assert "items" in api.sync()
+    assert api.sync()["http_code"] == 429
+
+
+def test_http_session_reuses_its_connection(fake_server):
+    interface = TodoistInterface.from_token(
+        "test", api_endpoint=fake_server.url, cache=None
+    )
+    interface.sync()
+    interface.tasks_by_id["1"].update(content="Task 1 (edited)")
+    interface.commit()
+    interface.sync()
+
+    assert fake_server.request_count == 3
+    assert fake_server.connection_count == 1
+    assert interface.get_task_by_content("Task 1 (edited)") is not None
+
+
+def test_cache_is_written_atomically(fake_server, tmp_path):
+    cache = f"{tmp_path}/cache/"
+    interface = TodoistInterface.from_token(
+        "test", api_endpoint=fake_server.url, cache=cache
+    )
+    interface.sync()
+
+    assert sorted(path.name for path in (tmp_path / "cache").iterdir()) == [
+        "test.json",
+        "test.json.lock",
+        "test.sync",
+    ]
+    other = TodoistInterface.from_token(
+        "test", api_endpoint=fake_server.url, cache=cache
+    )
+    assert len(other.api.state["items"]) == 9
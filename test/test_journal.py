@@ -0,0 +1,87 @@
+from rplugin.python3.pytodoist import (
+    CommandJournal,
+    TodoistInterface,
+)
+
+
+def test_offline_commits_are_journaled_and_replayed(fake_server, tmp_path):
+    journal_path = tmp_path / "journal.jsonl"
+    interface = TodoistInterface.from_token(
+        "test",
+        api_endpoint=fake_server.url,
+        cache=None,
+        journal=CommandJournal(journal_path),
+    )
+    interface.sync()
+
+    # Going offline.
+    interface.api.api_endpoint = "http://127.0.0.1:1"
+    new_task = interface.add_task(content="Task 10", project_id="1")
+    new_task.update(content="Task 10 (edited)")
+    interface.commit()
+    interface.sync()
+
+    assert interface.is_offline
+    assert len(interface.journal) == 2
+    assert interface.get_task_by_content("Task 10 (edited)") is not None
+
+    # Restarting, with the network back.
+    interface = TodoistInterface.from_token(
+        "test",
+        api_endpoint=fake_server.url,
+        cache=None,
+        journal=CommandJournal(journal_path),
+    )
+    interface.sync()
+
+    assert not interface.is_offline
+    assert len(interface.journal) == 0
+    assert len(CommandJournal(journal_path)) == 0
+    contents = [item["content"] for item in fake_server.state.objects["items"].values()]
+    assert contents.count("Task 10 (edited)") == 1
+    assert "Task 10" not in contents
+
+
+def test_journal_is_kept_when_the_response_is_not_json(fake_server, tmp_path):
+    interface = TodoistInterface.from_token(
+        "test",
+        api_endpoint=fake_server.url,
+        cache=None,
+        journal=CommandJournal(tmp_path / "journal.jsonl"),
+    )
+    interface.sync()
+
+    fake_server.bad_gateway = True
+    interface.add_task(content="Task 10", project_id="1")
+    assert interface.commit() is None
+    assert interface.is_offline
+    assert len(interface.journal) == 1
+
+    fake_server.bad_gateway = False
+    interface.sync()
+    assert not interface.is_offline
+    assert len(interface.journal) == 0
+    assert interface.get_task_by_content("Task 10") is not None
+
+
+def test_journal_ignores_truncated_records(tmp_path):
+    journal_path = tmp_path / "journal.jsonl"
+    journal = CommandJournal(journal_path)
+    journal.append([{"uuid": "1", "type": "item_delete", "args": {"id": "1"}}])
+    with journal_path.open("a") as f:
+        f.write('{"op": "command", "comm')
+
+    assert list(CommandJournal(journal_path).pending.keys()) == ["1"]
+
+
+def test_journal_shared_between_instances(tmp_path):
+    journal_path = tmp_path / "journal.jsonl"
+    first, second = CommandJournal(journal_path), CommandJournal(journal_path)
+    first.append([{"uuid": "1", "type": "item_delete", "args": {"id": "1"}}])
+    second.append([{"uuid": "2", "type": "item_delete", "args": {"id": "2"}}])
+
+    # The compaction triggered by the first instance keeps the second one's command.
+    first.acknowledge(["1"], dict())
+    assert list(CommandJournal(journal_path).pending.keys()) == ["2"]
+    second.acknowledge(["2"], dict())
+    assert journal_path.read_text() == ""
@@ -1,6 +1,13 @@
 import pytest
 
-from rplugin.python3.pytodoist import ParsedBuffer, Project, Task, ProjectUnderline
+from rplugin.python3.pytodoist import (
+    Diff,
+    ParsedBuffer,
+    Project,
+    Task,
+    ProjectUnderline,
+    line_edits,
+)
 
 
 def test_interface(todoist_api):
@@ -995,3 +1002,240 @@ def test_create_new_task_and_assign_label(plugin, vim):
     assert isinstance(item["args"], dict)
     assert item["args"]["id"] == "2"
     assert item["args"]["labels"] == ["1"]
+
+
+def test_line_edits():
+    old = ["Project 1", "=========", "[ ] Task 1", "[ ] Task 2", "[ ] Task 3"]
+    new = ["Project 1", "=========", "[ ] Task 0", "[ ] Task 1", "[ ] Task 3 (edited)"]
+
+    edits = line_edits(old, new)
+    lines = list(old)
+    for start, end, replacement in edits:
+        lines[start:end] = replacement
+
+    assert lines == new
+    assert sum(len(replacement) for _, _, replacement in edits) == 2
+
+
+def test_snapshots_share_their_unchanged_lines(interface):
+    lines = [str(item) for item in interface] + ["[ ] New task", "[ ] Other task"]
+    edited_lines = lines[:-1] + ["[ ] Other task (edited)"]
+    # Lines read from Neovim are new strings every time.
+    baseline = ParsedBuffer([line.encode().decode() for line in lines], interface)
+    snapshot = ParsedBuffer([line.encode().decode() for line in edited_lines])
+
+    for i in range(len(lines) - 1):
+        assert snapshot._raw_lines[i] is baseline._raw_lines[i]
+    # Including the tasks that aren't synced yet.
+    assert snapshot[-2] is baseline[-2]
+    assert snapshot[-1] is not baseline[-1]
+    assert snapshot[-1].content == "Other task (edited)"
+
+
+def test_updating_a_line_does_not_affect_the_other_snapshots(interface):
+    lines = [str(item) for item in interface]
+    # Two new tasks with the same content, at the end of `Project 1`.
+    edited_lines = lines[:5] + ["[ ] Foo", "[ ] Foo"] + lines[5:]
+    baseline = ParsedBuffer(lines, interface)
+    current = ParsedBuffer(edited_lines, interface)
+
+    current.get_item_for_update(5).complete(impact_remote=False)
+    assert str(current[5]) == "[X] [Completed]"
+    assert str(current[6]) == "[ ] Foo"
+
+    # Then the completed line is deleted, and the buffer saved.
+    baseline.compare_with(ParsedBuffer(lines[:5] + ["[ ] Foo"] + lines[5:]))
+    assert [command["type"] for command in interface.api.queue] == ["item_add"]
+    assert interface.api.queue[0]["args"]["content"] == "Foo"
+
+
+def test_complete_a_new_task_with_a_duplicate(plugin, vim):
+    plugin.load_tasks(args=[])
+
+    # Adding `Foo` twice after `[ ] Task 3`, then completing the first one.
+    vim.command("call setpos('.', [1, 5, 1, 0])")
+    vim.command("normal oFoo")
+    vim.command("normal oFoo")
+    vim.command("call setpos('.', [1, 6, 1, 0])")
+    plugin.complete_task(args=[])
+    vim.command(":w")
+
+    assert [command["type"] for command in plugin.todoist.api.queue] == ["item_add"]
+    assert plugin.todoist.api.queue[0]["args"]["content"] == "Foo"
+
+
+def test_replace_lines_keeps_the_other_items(interface):
+    interface.expanded_projects = {"1", "3"}
+    snapshot = ParsedBuffer([str(item) for item in interface], interface)
+    assert str(snapshot[8]) == "[+] 3 tasks"
+    # `Task 2` is completed (see `Plugin.complete_task`), then `Project 2` expanded.
+    snapshot[3].complete(impact_remote=False)
+    interface.expanded_projects.add("2")
+    lines = [str(item) for item in interface]
+
+    snapshot = snapshot.replace_lines(8, 9, lines[8:11])
+    assert [str(item) for item in snapshot[8:11]] == lines[8:11]
+    assert snapshot[3].id == "2"
+
+    snapshot.compare_with(ParsedBuffer(lines[:3] + lines[4:]))
+    assert [command["type"] for command in interface.api.queue] == ["item_complete"]
+    assert interface.api.queue[0]["args"]["id"] == "2"
+
+
+def test_complete_task_then_toggle_project_and_save(plugin, vim):
+    plugin.todoist.expanded_projects = {"1", "3"}
+    plugin.load_tasks(args=[])
+
+    # Completing `Task 2`, then expanding `Project 2`.
+    vim.command("call setpos('.', [1, 4, 1, 0])")
+    plugin.complete_task(args=[])
+    vim.command("call setpos('.', [1, 7, 1, 0])")
+    plugin.toggle_project(args=[])
+    vim.command(":w")
+
+    assert [command["type"] for command in plugin.todoist.api.queue] == [
+        "item_complete"
+    ]
+    assert plugin.todoist.api.queue[0]["args"]["id"] == "2"
+
+
+def test_toggle_a_project_that_is_not_saved(plugin, vim):
+    plugin.todoist.expanded_projects = {"1", "3"}
+    plugin.load_tasks(args=[])
+    new_lines = ["New project", "===========", "[ ] New task", ""]
+    vim.current.buffer[0:0] = new_lines
+    plugin.text_changed()
+
+    vim.command("call setpos('.', [1, 1, 1, 0])")
+    plugin.toggle_project(args=[])
+
+    assert vim.current.buffer[:4] == new_lines
+    assert plugin.todoist.expanded_projects == {"1", "3"}
+
+
+def test_diff_leaves_out_identical_lines():
+    lines = [f"[ ] Task {i}" for i in range(100)]
+    edited_lines = list(lines)
+    edited_lines[50] = "[ ] Task 50 (edited)"
+    edited_lines.insert(80, "[ ] New task")
+
+    assert list(Diff(ParsedBuffer(lines), ParsedBuffer(lines))) == []
+
+    diff = Diff(ParsedBuffer(lines), ParsedBuffer(edited_lines))
+    assert diff.offset == 50
+    segments = [
+        (segment.action_type, segment.from_index, segment.to_index, list(segment))
+        for segment in diff
+    ]
+    assert segments == [
+        ("a", 80, 81, ["[ ] New task"]),
+        ("c", 51, 52, ["[ ] Task 50 (edited)"]),
+    ]
+
+
+def test_diff_aligns_the_lines_of_both_buffers():
+    lines = ["[ ] Task 1", "[ ] Task 2", "[ ] Task 3", "[ ] Task 4"]
+    edited_lines = ["[ ] New task", "[ ] Task 1", "[ ] Task 2 (edited)", "[ ] Task 4"]
+
+    diff = Diff(ParsedBuffer(lines), ParsedBuffer(edited_lines))
+    segments = list(diff)
+    assert diff.align(segments) == [None, 0, 1, 3]
+    assert sorted(segment.rhs_index for segment in segments) == [0, 2]
+
+
+def test_indentation_is_saved_as_sub_tasks(remote_interface):
+    lines = [str(item) for item in remote_interface]
+    snapshot = ParsedBuffer(lines, remote_interface)
+    edited_lines = list(lines)
+    # Indenting `Task 4` under `Task 1`, and adding a sub-task to `Task 7`.
+    edited_lines[3] = "    [ ] Task 4"
+    edited_lines[4:5] = ["[ ] Task 7", "\t[ ] Task 10"]
+    snapshot.compare_with(ParsedBuffer(edited_lines))
+
+    commands = remote_interface.api.queue
+    assert [command["type"] for command in commands] == ["item_add", "item_move"]
+    assert commands[0]["args"]["parent_id"] == "7"
+    assert commands[1]["args"] == {"id": "4", "parent_id": "1"}
+
+    remote_interface.commit()
+    remote_interface.sync()
+    assert [str(item) for item in remote_interface][:6] == [
+        "Project 1",
+        "=========",
+        "[ ] Task 1",
+        "    [ ] Task 4",
+        "[ ] Task 7",
+        "    [ ] Task 10",
+    ]
+
+    # Outdenting moves the task back to the root of its project.
+    lines = [str(item) for item in remote_interface]
+    snapshot = ParsedBuffer(lines, remote_interface)
+    edited_lines = list(lines)
+    edited_lines[3] = "[ ] Task 4"
+    snapshot.compare_with(ParsedBuffer(edited_lines))
+    assert remote_interface.api.queue[0]["args"] == {"id": "4", "project_id": "1"}
+
+
+def test_sub_tasks_sharing_a_content_keep_their_parent(remote_interface):
+    remote_interface.add_task(content="Call mom", project_id="1", parent_id="1")
+    remote_interface.add_task(content="Call mom", project_id="1", parent_id="4")
+    remote_interface.commit()
+    remote_interface.sync()
+    lines = [str(item) for item in remote_interface]
+    assert lines[2:7] == [
+        "[ ] Task 1",
+        "    [ ] Call mom",
+        "[ ] Task 4",
+        "    [ ] Call mom",
+        "[ ] Task 7",
+    ]
+
+    # Saving the unchanged buffer doesn't move anything.
+    ParsedBuffer(lines, remote_interface).compare_with(ParsedBuffer(lines))
+    assert remote_interface.api.queue == []
+
+    # Only the outdented task moves, and so do new tasks sharing a content.
+    edited_lines = list(lines)
+    edited_lines[5] = "[ ] Call mom"
+    edited_lines[3:4] = ["    [ ] Call mom", "        [ ] Call dad"]
+    edited_lines[7:8] = ["[ ] Task 7", "    [ ] Call dad"]
+    ParsedBuffer(lines, remote_interface).compare_with(ParsedBuffer(edited_lines))
+    commands = remote_interface.api.queue
+    assert [command["type"] for command in commands] == [
+        "item_add",
+        "item_add",
+        "item_move",
+    ]
+    assert commands[0]["args"]["parent_id"] == "10"
+    assert commands[1]["args"]["parent_id"] == "7"
+    assert commands[2]["args"] == {"id": "11", "project_id": "1"}
+
+
+def test_load_tasks_uses_the_prefetched_state(plugin, vim):
+    sync_count = 0
+    sync = plugin.todoist.sync
+
+    def counted_sync():
+        nonlocal sync_count
+        sync_count += 1
+        sync()
+
+    plugin.todoist.sync = counted_sync
+    plugin.prefetch([])
+    plugin.load_tasks([])
+    assert sync_count == 1
+    assert vim.current.buffer[0] == "Project 1"
+
+    # The prefetched state is only used once.
+    plugin.load_tasks([])
+    assert sync_count == 2
+
+
+def test_search_before_loading_the_tasks(plugin, vim):
+    plugin.parsed_buffer = None
+    plugin.todoist_search(["Task", "5"])
+
+    plugin.load_tasks(args=[])
+    plugin.todoist_search(["Task", "5"])
+    assert vim.current.window.cursor == [10, 0]
@@ -0,0 +1,188 @@
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import rplugin.python3.pytodoist as pytodoist
+
+from fakes import GeneratedFakeApi
+from rplugin.python3.pytodoist import ParsedBuffer, TodoistInterface
+
+# Budgets are expressed relatively to a calibration loop, so that these tests don't
+# depend on the speed of the machine running them. They are generous: they are meant
+# to catch quadratic behaviours, not small regressions.
+PARSE_BUDGET = 25
+# The calibration loop takes about 30 ms, and a search should answer in well under
+# 10 ms on 50k tasks.
+SEARCH_BUDGET = 0.3
+MAX_SCALING_RATIO = 30
+
+
+def calibrate() -> float:
+    def loop():
+        for i in range(100_000):
+            "[ ] Task %d" % i
+
+    return best_of(loop)
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def generated_interface(n_tasks: int) -> TodoistInterface:
+    interface = TodoistInterface(
+        GeneratedFakeApi(n_projects=max(1, n_tasks // 20), n_tasks=n_tasks, depth=3)
+    )
+    interface.sync()
+    return interface
+
+
+def count_rpcs(plugin, fn, *args) -> int:
+    rpc_count = plugin.stats.rpc_count
+    fn(*args)
+    return plugin.stats.rpc_count - rpc_count
+
+
+LOAD_PLUGIN = """
+import sys, types, inspect
+import rplugin.python3.pytodoist as pytodoist
+plugin = pytodoist.Plugin(types.SimpleNamespace(request=None))
+# Like the plugin host, looking for the handlers.
+handlers = inspect.getmembers(plugin, lambda m: hasattr(m, "_nvim_rpc_method_name"))
+assert handlers and plugin.todoist is None and plugin.poller is None
+print(",".join(name for name in ["requests", "todoist", "difflib"] if name in sys.modules))
+"""
+
+
+@pytest.mark.parametrize("api_key", [None, "test"])
+def test_loading_the_plugin_is_cheap(api_key):
+    # In a fresh interpreter: the test session already imported everything.
+    env = {k: v for k, v in os.environ.items() if k != "TODOIST_API_KEY"}
+    if api_key is not None:
+        env["TODOIST_API_KEY"] = api_key
+    output = subprocess.run(
+        [sys.executable, "-c", LOAD_PLUGIN],
+        capture_output=True,
+        check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+        env=env,
+    )
+
+    # Finding the handlers doesn't connect: neither the client nor the heavy
+    # dependencies are loaded, and the missing key only matters once the workspace
+    # is used.
+    assert output.stdout.decode().strip() == ""
+
+
+def test_parsed_buffer_parse_time():
+    interface = generated_interface(20_000)
+    lines = [str(item) for item in interface]
+
+    duration = best_of(lambda: ParsedBuffer(lines, interface))
+
+    assert duration < PARSE_BUDGET * calibrate()
+
+
+def test_parsed_buffer_parse_time_scales_linearly():
+    durations = []
+    for n_tasks in [2_000, 20_000]:
+        interface = generated_interface(n_tasks)
+        lines = [str(item) for item in interface]
+        durations.append(best_of(lambda: ParsedBuffer(lines, interface)))
+
+    assert durations[1] / durations[0] < MAX_SCALING_RATIO
+
+
+def test_sync_time_scales_linearly():
+    durations = []
+    for n_tasks in [2_000, 20_000]:
+        interface = generated_interface(n_tasks)
+        durations.append(best_of(interface.sync))
+
+    assert durations[1] / durations[0] < MAX_SCALING_RATIO
+
+
+def test_search_time():
+    interface = generated_interface(50_000)
+    budget = SEARCH_BUDGET * calibrate()
+
+    for query in ["Task 4242", "task", "Tsak 42", "ask 1", "milk"]:
+        duration = best_of(lambda: interface.search(query))
+        assert duration < budget, query
+
+    assert interface.search("Task 4242")[0].content == "Task 4242"
+
+
+def test_load_tasks_rpc_count_does_not_depend_on_buffer_length(plugin, vim):
+    rpc_counts = []
+    for n_tasks in [100, 100, 2_000]:
+        # The first iteration creates the `.todoist` buffer, so it isn't compared.
+        plugin.todoist = generated_interface(n_tasks)
+        rpc_counts.append(count_rpcs(plugin, plugin.load_tasks, []))
+
+    assert rpc_counts[1] == rpc_counts[2]
+
+
+def test_text_changed_rpc_count_does_not_depend_on_buffer_length(plugin, vim):
+    rpc_counts = []
+    for n_tasks in [100, 2_000]:
+        plugin.todoist = generated_interface(n_tasks)
+        plugin.load_tasks([])
+        vim.command("call setpos('.', [1, 3, 1, 0])")
+        vim.command("normal oNew task")
+        rpc_counts.append(count_rpcs(plugin, plugin.text_changed))
+
+    assert rpc_counts[0] == rpc_counts[1]
+
+
+def test_highlights_are_limited_to_the_viewport(plugin, vim, monkeypatch):
+    monkeypatch.setattr(pytodoist, "VIEWPORT_THRESHOLD", 100)
+    plugin.todoist = generated_interface(2_000)
+    plugin.load_tasks([])
+    namespace = plugin._get_highlight_namespace()
+
+    highlights = vim.api.buf_get_extmarks(0, namespace, 0, -1, {})
+    assert len(highlights) <= vim.eval("line('w$')") + pytodoist.VIEWPORT_MARGIN
+
+    # Scrolling within the margin is free, further away re-highlights.
+    top, bottom = vim.eval("[line('w0'), line('w$')]")
+    assert count_rpcs(plugin, plugin.viewport_changed, [top + 1, bottom + 1]) == 0
+    vim.command("normal! 1500G")
+    top, bottom = vim.eval("[line('w0'), line('w$')]")
+    assert count_rpcs(plugin, plugin.viewport_changed, [top, bottom]) == 1
+    assert vim.api.buf_get_extmarks(0, namespace, [top - 1, 0], [top - 1, -1], {})
+    # The highlights of the previous viewport are cleared.
+    assert not vim.api.buf_get_extmarks(
+        0, namespace, 0, [top - 2 - pytodoist.VIEWPORT_MARGIN, -1], {}
+    )
+    highlights = vim.api.buf_get_extmarks(0, namespace, 0, -1, {})
+    assert len(highlights) <= bottom - top + 1 + 2 * pytodoist.VIEWPORT_MARGIN
+
+
+def test_large_workspaces_are_rendered_progressively(plugin, vim, monkeypatch):
+    monkeypatch.setattr(pytodoist, "VIEWPORT_THRESHOLD", 100)
+    monkeypatch.setattr(pytodoist, "RENDER_CHUNK_SIZE", 500)
+    plugin.todoist = generated_interface(2_000)
+    expected_lines = [str(item) for item in plugin.todoist]
+
+    plugin.load_tasks([])
+    # Only the first screen is written by `load_tasks` itself.
+    assert len(vim.current.buffer) < len(expected_lines)
+    assert vim.current.buffer[0] == expected_lines[0]
+
+    # The other chunks are written by the calls scheduled on the event loop.
+    for _ in range(100):
+        if plugin.parsed_buffer_since_last_save is not None:
+            break
+        vim.eval("1")
+    assert vim.current.buffer[:] == expected_lines
+    assert not vim.eval("&modified")
@@ -0,0 +1,91 @@
+import todoist
+
+from rplugin.python3.pytodoist import TodoistInterface
+
+
+def test_polled_changes_are_applied_unless_outdated(fake_server, remote_interface):
+    sync_token, response = remote_interface.fetch_changes()
+    assert not TodoistInterface.has_changes(response)
+
+    other_client = todoist.TodoistAPI("test", api_endpoint=fake_server.url, cache=None)
+    other_client.sync()
+    other_client.items.update("3", content="Edited elsewhere")
+    other_client.commit()
+
+    sync_token, response = remote_interface.fetch_changes()
+    assert TodoistInterface.has_changes(response)
+    assert remote_interface.get_task_by_content("Edited elsewhere") is None
+    assert remote_interface.apply_changes(sync_token, response)
+    assert remote_interface.get_task_by_content("Edited elsewhere") is not None
+    # The workspace was synced since: these changes are outdated.
+    assert not remote_interface.apply_changes(sync_token, response)
+
+
+def test_polls_keep_the_latest_changes_while_the_buffer_is_modified(
+    plugin, vim, fake_server, remote_interface
+):
+    plugin.todoist = remote_interface
+    plugin.load_tasks([])
+    vim.command("normal oNew task")
+    applies = []
+    apply_remote_changes = plugin._apply_remote_changes
+
+    def counted_apply(*args):
+        applies.append(args)
+        apply_remote_changes(*args)
+
+    plugin._apply_remote_changes = counted_apply
+    other_client = todoist.TodoistAPI("test", api_endpoint=fake_server.url, cache=None)
+    other_client.sync()
+    for i in range(3):
+        other_client.items.update("3", content=f"Edited elsewhere {i}")
+        other_client.commit()
+        for _ in range(5):
+            plugin._poll()
+            # Processing the calls scheduled by the poll.
+            vim.eval("1")
+
+    # Polls without new changes don't apply them again, and only the latest changes
+    # are kept.
+    assert len(applies) == 3
+    sync_token, response = plugin.pending_remote_changes
+    assert sync_token == remote_interface.api.sync_token
+    assert [item["content"] for item in response["items"]] == ["Edited elsewhere 2"]
+    assert vim.eval("&modified")
+
+
+def test_parked_changes_are_applied_once_the_buffer_is_clean(
+    plugin, vim, fake_server, remote_interface
+):
+    plugin.todoist = remote_interface
+    plugin.load_tasks([])
+    other_client = todoist.TodoistAPI("test", api_endpoint=fake_server.url, cache=None)
+    other_client.sync()
+
+    def edit_elsewhere(content: str):
+        other_client.items.update("3", content=content)
+        other_client.commit()
+        plugin._poll()
+        # Processing the calls scheduled by the poll.
+        vim.eval("1")
+
+    # Undoing the unsaved changes.
+    vim.command("normal oNew task")
+    edit_elsewhere("Edited elsewhere")
+    assert plugin.pending_remote_changes is not None
+    vim.command("undo")
+    assert not vim.eval("&modified")
+    plugin._poll()
+    vim.eval("1")
+    assert plugin.pending_remote_changes is None
+    assert "[ ] Edited elsewhere" in vim.current.buffer[:]
+
+    # Coming back from another buffer.
+    vim.command("set hidden")
+    vim.command("enew")
+    edit_elsewhere("Edited elsewhere again")
+    assert plugin.pending_remote_changes is not None
+    vim.command("buffer .todoist")
+    plugin.buf_enter()
+    assert plugin.pending_remote_changes is None
+    assert "[ ] Edited elsewhere again" in vim.current.buffer[:]
@@ -0,0 +1,50 @@
+import json
+
+import rplugin.python3.pytodoist as pytodoist
+
+from rplugin.python3.pytodoist import RpcStats
+
+
+class FakeNvim:
+    def request(self, name, *args, **kwargs):
+        return name
+
+
+def test_rpcs_are_counted():
+    nvim = FakeNvim()
+    stats = RpcStats()
+    stats.instrument(nvim)
+
+    assert nvim.request("nvim_command", "echo") == "nvim_command"
+    nvim.request("nvim_command", "echo")
+    nvim.request("nvim_eval", "1")
+
+    assert stats.rpc_count == 3
+    assert stats.rpc_count_by_method["nvim_command"] == 2
+
+
+def test_percentiles_and_log(tmp_path):
+    log_path = tmp_path / "stats.jsonl"
+    stats = RpcStats(log_path=str(log_path), window=10)
+    for i in range(1, 21):
+        stats.record("load_tasks", duration=i / 1000, rpc_count=3)
+
+    # Only the last 10 calls are kept.
+    assert stats.percentiles("load_tasks") == {50: 0.016, 90: 0.02, 99: 0.02}
+    assert "load_tasks" in stats.summary()[1]
+
+    entries = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert len(entries) == 20
+    assert entries[0]["handler"] == "load_tasks"
+    assert entries[0]["rpcs"] == 3
+
+
+def test_plugin_logs_to_a_file_only_when_asked(monkeypatch, tmp_path):
+    monkeypatch.setattr(pytodoist, "STATS_LOG_PATH", None)
+    assert pytodoist.Plugin(FakeNvim()).stats.log_path is None
+
+    log_path = tmp_path / "stats.jsonl"
+    monkeypatch.setattr(pytodoist, "STATS_LOG_PATH", str(log_path))
+    plugin = pytodoist.Plugin(FakeNvim())
+    plugin.stats.record("load_tasks", duration=0.001, rpc_count=1)
+    assert len(log_path.read_text().splitlines()) == 1
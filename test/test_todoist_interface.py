@@ -0,0 +1,136 @@
+from fakes import FakeApi
+from rplugin.python3.pytodoist import (
+    CollapsedTasks,
+    CustomSection,
+    ParsedBuffer,
+    TodoistInterface,
+)
+
+
+def test_declarative_section_matches_lambda_section(interface):
+    lambda_section = CustomSection("Lambda", lambda task: "Label 1" in task.labels)
+    declarative_section = CustomSection("Declarative", labels=["Label 1"])
+
+    lambda_tasks = interface.filter_tasks(lambda_section)
+    declarative_tasks = interface.filter_tasks(declarative_section)
+
+    assert [task.content for task in lambda_tasks] == ["Task 1", "Task 7"]
+    assert [task.content for task in declarative_tasks] == ["Task 1", "Task 7"]
+
+
+def test_declarative_section_with_project(interface):
+    section = CustomSection("Section", labels=["Label 1"], project="Project 3")
+    assert [task.content for task in interface.filter_tasks(section)] == ["Task 7"]
+
+
+def test_declarative_section_with_unknown_label(interface):
+    section = CustomSection("Section", labels=["Unknown label"])
+    assert interface.filter_tasks(section) == []
+
+
+def test_declarative_section_with_priority_and_due_date(interface):
+    interface.tasks_by_id["4"].data["priority"] = 4
+    interface.tasks_by_id["4"].data["due"] = {"date": "2021-03-02"}
+    interface.tasks_by_id["5"].data["priority"] = 4
+    interface.tasks_by_id["5"].data["due"] = {"date": "2021-03-10T10:00:00"}
+    # The indexes are updated at sync time.
+    interface.sync()
+    assert interface.get_task_ids_due("2021-03-02", "2021-03-10") == ["4", "5"]
+    assert interface.get_task_ids_due(end="2021-03-09") == ["4"]
+
+    section = CustomSection("Section", priority=[3, 4])
+    # Resolved through the indexes, rather than by checking every task.
+    assert section.lookup(interface) == {"4", "5"}
+    assert [task.content for task in interface.filter_tasks(section)] == [
+        "Task 4",
+        "Task 5",
+    ]
+
+    section = CustomSection("Section", priority=4, due=("2021-03-01", "2021-03-07"))
+    assert [task.content for task in interface.filter_tasks(section)] == ["Task 4"]
+
+
+def test_custom_sections_are_rendered_last(interface):
+    lines = [str(item) for item in interface]
+    assert lines[-5:] == [
+        "Custom Section",
+        "--------------",
+        "[ ] Task 1",
+        "[ ] Task 7",
+        "",
+    ]
+
+
+def test_label_lookups(interface):
+    label = interface.get_label_by_name("Label 2")
+    assert label.id == "2"
+    assert label.name == "Label 2"
+    assert interface.get_label_by_id("2") is label
+    assert interface.get_label_by_name("Unknown label") is None
+
+
+def test_task_labels_use_label_wrappers(interface):
+    task = interface.tasks_by_id["1"]
+    assert task.labels == [interface.get_label_by_id("1")]
+
+
+def test_search(interface):
+    assert [task.content for task in interface.search("Task 7")][0] == "Task 7"
+    assert interface.search("zzz") == []
+
+
+def test_search_index_is_updated_on_sync(interface):
+    item = interface.api.state["items"][0]
+    item.data["content"] = "Buy some milk"
+    interface.sync()
+    # The index is brought up to date by the sync itself.
+    assert interface.search_index.search("milk") == [item["id"]]
+    assert [task.content for task in interface.search("milk")] == ["Buy some milk"]
+    assert len(interface.search_index) == 9
+
+
+def test_collapsed_projects(interface):
+    interface.expanded_projects = {"2"}
+    lines = [str(item) for item in interface]
+    assert lines[:10] == [
+        "Project 1",
+        "=========",
+        "[+] 3 tasks",
+        "",
+        "Project 2",
+        "=========",
+        "[ ] Task 4",
+        "[ ] Task 5",
+        "[ ] Task 6",
+        "",
+    ]
+
+    parsed_buffer = ParsedBuffer(lines, interface)
+    assert isinstance(parsed_buffer[2], CollapsedTasks)
+    assert parsed_buffer[2].count == 3
+
+    # Tasks added to a collapsed project are created, the placeholder is ignored.
+    edited_lines = list(lines)
+    edited_lines[2:3] = ["[+] 4 tasks", "[ ] Task 10"]
+    parsed_buffer.compare_with(ParsedBuffer(edited_lines))
+    assert [command["type"] for command in interface.api.queue] == ["item_add"]
+    assert interface.api.queue[0]["args"]["project_id"] == "1"
+
+
+def test_workspace_restricted_to_a_project_subtree(custom_sections):
+    interface = TodoistInterface(
+        FakeApi(), custom_sections=custom_sections, project_names=["project 2"]
+    )
+    interface.sync()
+
+    # Project 2 is selected, and Project 1 is kept because it's the Inbox.
+    assert sorted(project.name for project in interface.projects) == [
+        "Project 1",
+        "Project 2",
+    ]
+    assert sorted(task.content for task in interface.tasks) == [
+        f"Task {i}" for i in range(1, 7)
+    ]
+    lines = [str(item) for item in interface]
+    assert "Project 3" not in lines
+    assert "[ ] Task 7" not in lines